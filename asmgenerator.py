@@ -0,0 +1,509 @@
+import re
+import struct
+
+from collections import Counter
+
+from codegenerator import MAIN_FUNCTION
+from ir import Op, Temp, COMPARISON_OPS, operands
+from cfg import split_functions, ControlFlowGraph
+from regalloc import allocate_registers, local_types
+from tracing import get_tracer
+
+tracer = get_tracer('codegen')
+
+ASM_OPERATORS = {Op.ADD: 'addq', Op.SUB: 'subq', Op.MUL: 'imulq'}
+ASM_SET_CONDITION = {Op.LT: 'setl', Op.LE: 'setle', Op.GT: 'setg', Op.GE: 'setge', Op.EQ: 'sete', Op.NE: 'setne'}
+COMMUTATIVE_ASM = frozenset((Op.ADD, Op.MUL))
+SSE_OPERATORS = {Op.ADD: 'addsd', Op.SUB: 'subsd', Op.MUL: 'mulsd', Op.DIV: 'divsd'}
+# ucomisd sets the flags like an unsigned compare, and an unordered result (a
+# NaN operand) sets ZF, PF and CF alike. Only seta and setae are false then, so
+# < and <= compare the operands the other way round, and == and <> also look
+# at PF: (operand order, set instruction, PF set instruction, combining op).
+SSE_SET_CONDITION = {Op.LT: (True, 'seta', None, None), Op.LE: (True, 'setae', None, None),
+                     Op.GT: (False, 'seta', None, None), Op.GE: (False, 'setae', None, None),
+                     Op.EQ: (False, 'sete', 'setnp', 'andb'), Op.NE: (False, 'setne', 'setp', 'orb')}
+
+# System V AMD64: the first six int arguments in these registers, the first
+# eight doubles in %xmm0-%xmm7, the rest on the stack right to left
+INT_ARGUMENT_REGISTERS = ('%rdi', '%rsi', '%rdx', '%rcx', '%r8', '%r9')
+FLOAT_ARGUMENT_REGISTERS = tuple(f"%xmm{number}" for number in range(8))
+
+# print(int) and print(double) on top of printf
+RUNTIME = (
+    "    .section .rodata",
+    ".Lprint_int_format:",
+    '    .string "%ld\\n"',
+    ".Lprint_double_format:",
+    '    .string "%g\\n"',
+    "    .text",
+    "print:",
+    "    pushq %rbp",
+    "    movq %rsp, %rbp",
+    "    movq %rdi, %rsi",
+    "    leaq .Lprint_int_format(%rip), %rdi",
+    "    xorl %eax, %eax",
+    "    call printf@PLT",
+    "    leave",
+    "    ret",
+    "print_double:",
+    "    pushq %rbp",
+    "    movq %rsp, %rbp",
+    "    leaq .Lprint_double_format(%rip), %rdi",
+    "    movl $1, %eax",
+    "    call printf@PLT",
+    "    leave",
+    "    ret",
+)
+
+
+CONSTANT_REFERENCE = re.compile(r'\.LC(\d+)\(%rip\)')
+
+# Program functions and globals get symbols of their own, so no name a program
+# uses can clash with the runtime's labels, with libc, or with each other. The
+# program body is the entry point and keeps its name.
+FUNCTION_PREFIX = 'cp_fn_'
+GLOBAL_PREFIX = 'cp_var_'
+
+
+def function_symbol(name):
+    return name if name == MAIN_FUNCTION else f"{FUNCTION_PREFIX}{name}"
+
+
+def global_symbol(name):
+    return f"{GLOBAL_PREFIX}{name}"
+
+
+def is_memory(location):
+    return '(' in location
+
+
+def fits_imm32(value):
+    return -2 ** 31 <= value < 2 ** 31
+
+
+def assign_arguments(types):
+    # The System V location of each argument: a register, or None for the stack
+    int_registers = iter(INT_ARGUMENT_REGISTERS)
+    float_registers = iter(FLOAT_ARGUMENT_REGISTERS)
+    return [next(float_registers if type == 'double' else int_registers, None) for type in types]
+
+
+class AssemblyGenerator:
+    # Lowers the optimized quads to a GNU as source file for x86-64 Linux (AT&T
+    # syntax), one function at a time. Each function gets its registers from
+    # regalloc; spilled values, doubles, local arrays and saved callee-saved
+    # registers live in 8-byte slots below %rbp. Globals are .comm symbols
+    # addressed relative to %rip, double constants live in .rodata, and calls
+    # follow the System V ABI. %rax, %rdx, %r11, %xmm0 and %xmm1 are scratch.
+    #
+    # A function's code only depends on the globals and function signatures
+    # declared beforehand, so functions can be generated separately, even in
+    # other processes, and joined by link(). Each function numbers its double
+    # constants from .LC0; link() renumbers them across the file.
+
+    def __init__(self, quads, allocator='linear'):
+        self.quads = quads
+        self.allocator = allocator
+        self.asm_code = []
+        self.globals = {}
+        self.global_types = {}
+        self.signatures = {}
+        self.return_types = {}
+        self.constants = {}
+
+    def emit(self, instruction):
+        self.asm_code.append(f"    {instruction}")
+
+    def emit_label(self, label):
+        self.asm_code.append(f"{label}:")
+
+    def generate(self):
+        global_quads, functions = split_functions(self.quads)
+        for quad in global_quads:
+            self.declare_global(quad)
+        for function in functions:
+            self.declare_function(function[0].arg1, function[0].type, [quad.type for quad in function if quad.op == Op.PARAM])
+        return self.link([self.generate_function(ControlFlowGraph(function)) for function in functions])
+
+    def declare_global(self, quad):
+        self.globals[quad.result] = quad.arg1
+        self.global_types[quad.result] = quad.type
+
+    def declare_function(self, name, return_type, param_types):
+        self.return_types[name] = return_type
+        self.signatures[name] = param_types
+
+    def link(self, functions):
+        # The whole file from (code, constants) pairs as generate_function
+        # returns them, in order. Constants are numbered in order of first use
+        # and shared between functions.
+        self.asm_code = list(RUNTIME)
+        self.constants = {}
+        for asm_code, constants in functions:
+            labels = {}
+            for number, value in enumerate(constants):
+                if value not in self.constants:
+                    self.constants[value] = f".LC{len(self.constants)}"
+                labels[str(number)] = self.constants[value]
+            if all(label == f".LC{number}" for number, label in labels.items()):
+                self.asm_code.extend(asm_code)
+                continue
+            for line in asm_code:
+                if '.LC' in line:
+                    line = CONSTANT_REFERENCE.sub(lambda match: f"{labels[match.group(1)]}(%rip)", line)
+                self.asm_code.append(line)
+        for name, size in self.globals.items():
+            self.emit(f".comm {global_symbol(name)}, {8 * (size or 1)}, 8")
+        if self.constants:
+            self.emit(".section .rodata")
+            self.emit(".align 8")
+            for value, label in self.constants.items():
+                self.emit_label(label)
+                self.emit(f".quad {struct.unpack('<q', struct.pack('<d', value))[0]}  # {value!r}")
+        self.emit('.section .note.GNU-stack,"",@progbits')
+        return self.asm_code
+
+    def generate_function(self, graph):
+        # Returns the function's code and its double constants in order of
+        # first use, .LC0 first
+        self.asm_code = []
+        self.constants = {}
+        self.function = graph.name
+        self.allocation = allocate_registers(graph, self.allocator)
+        self.types = local_types(graph)
+        frame = self.allocation.frame
+        self.arrays = {}
+        self.locals = set()
+        params = []
+        for quad in graph.entry.quads:
+            if quad.op == Op.PARAM:
+                params.append(quad.result)
+                self.locals.add(quad.result)
+            elif quad.op == Op.ALLOC:
+                self.locals.add(quad.result)
+                if quad.arg1 is not None:
+                    self.arrays[quad.result] = frame.allocate(quad.arg1)
+        saved = [(register, frame.allocate()) for register in self.allocation.callee_saved_used()]
+
+        self.emit(".text")
+        symbol = function_symbol(self.function)
+        self.emit(f".globl {symbol}")
+        self.emit(f".type {symbol}, @function")
+        self.emit_label(symbol)
+        self.emit("pushq %rbp")
+        self.emit("movq %rsp, %rbp")
+        if frame.aligned_size():
+            self.emit(f"subq ${frame.aligned_size()}, %rsp")
+        for register, offset in saved:
+            self.emit(f"movq {register}, {offset}(%rbp)")
+        self.receive_parameters(params)
+
+        quads = graph.quads()
+        # A comparison read only by the branch right after it is computed into
+        # %rax, which leaves the peephole pass a set/branch pair it can fuse
+        uses = Counter(operand for quad in quads for operand in operands(quad) if isinstance(operand, Temp))
+        self.branch_conditions = {quad.result for quad, following in zip(quads, quads[1:])
+                                  if quad.op in COMPARISON_OPS and following.op == Op.IF_FALSE
+                                  and following.arg1 == quad.result and uses[quad.result] == 1}
+        for position, quad in enumerate(quads):
+            if quad.op == Op.RETURN:
+                self.generate_return(quad)
+                if position + 1 < len(quads):
+                    self.emit(f"jmp {self.epilogue_label()}")
+            else:
+                self.generate_quad(quad)
+        if not quads or quads[-1].op != Op.RETURN:
+            # Falling off the end; the program body exits with status 0
+            self.emit("xorl %eax, %eax")
+
+        self.emit_label(self.epilogue_label())
+        for register, offset in saved:
+            self.emit(f"movq {offset}(%rbp), {register}")
+        self.emit("leave")
+        self.emit("ret")
+        return self.asm_code, list(self.constants)
+
+    def receive_parameters(self, params):
+        moves = []
+        stack_offset = 16
+        for name, register in zip(params, assign_arguments([self.type_of(name) for name in params])):
+            source = register
+            if register is None:
+                source = f"{stack_offset}(%rbp)"
+                stack_offset += 8
+            destination = self.allocation.location(name)
+            if destination is None:
+                continue
+            if register is not None and register.startswith('%xmm'):
+                self.emit(f"movsd {register}, {destination}")
+            else:
+                moves.append((source, destination))
+        self.parallel_move(moves)
+
+    def epilogue_label(self):
+        return f".L{self.function}_epilogue"
+
+    def label(self, label):
+        return f".L{self.function}_{label}"
+
+    def type_of(self, value):
+        if isinstance(value, float):
+            return 'double'
+        if isinstance(value, int):
+            return 'int'
+        if value in self.types:
+            return self.types[value]
+        return self.global_types.get(value)
+
+    def location(self, name):
+        if name in self.branch_conditions:
+            return '%rax'
+        if name in self.locals or isinstance(name, Temp):
+            return self.allocation.location(name)
+        return f"{global_symbol(name)}(%rip)"
+
+    def operand(self, value):
+        if isinstance(value, (int, float)):
+            return f"${value}"
+        return self.location(value)
+
+    def value(self, value, scratch='%r11'):
+        # An operand usable as an instruction source: immediates that do not fit
+        # in 32 bits are loaded into scratch first
+        if isinstance(value, int) and not fits_imm32(value):
+            self.emit(f"movabsq ${value}, {scratch}")
+            return scratch
+        return self.operand(value)
+
+    def constant(self, value):
+        value = float(value)
+        if value not in self.constants:
+            self.constants[value] = f".LC{len(self.constants)}"
+        return f"{self.constants[value]}(%rip)"
+
+    def move(self, source, destination):
+        if source == destination:
+            return
+        if is_memory(source) and is_memory(destination):
+            self.emit(f"movq {source}, %rax")
+            source = '%rax'
+        self.emit(f"movq {source}, {destination}")
+
+    def load(self, value, destination):
+        # Int value into destination
+        if isinstance(value, int) and not fits_imm32(value):
+            self.emit(f"movabsq ${value}, {destination if not is_memory(destination) else '%rax'}")
+            if is_memory(destination):
+                self.move('%rax', destination)
+        else:
+            self.move(self.operand(value), destination)
+
+    def load_double(self, value, register):
+        if isinstance(value, (int, float)):
+            self.emit(f"movsd {self.constant(value)}, {register}")
+        elif self.type_of(value) == 'double':
+            self.emit(f"movsd {self.location(value)}, {register}")
+        else:
+            self.emit(f"cvtsi2sdq {self.location(value)}, {register}")
+
+    def store_double(self, register, name):
+        if self.type_of(name) == 'double':
+            self.emit(f"movsd {register}, {self.location(name)}")
+        else:
+            self.emit(f"cvttsd2siq {register}, %rax")
+            self.move('%rax', self.location(name))
+
+    def parallel_move(self, moves):
+        # Performs every (source, destination) move as if all sources were read
+        # first. Sources are locations or int constants. A move goes once nothing
+        # pending still reads its destination; a cycle of register moves is broken
+        # by parking one value in %r11.
+        pending = [(source, destination) for source, destination in moves if source != destination]
+        while pending:
+            for position, (source, destination) in enumerate(pending):
+                if all(other != destination for other, _ in pending):
+                    if isinstance(source, int):
+                        self.load(source, destination)
+                    else:
+                        self.move(source, destination)
+                    del pending[position]
+                    break
+            else:
+                destination = pending[0][1]
+                self.move(destination, '%r11')
+                pending = [('%r11' if source == destination else source, target) for source, target in pending]
+
+    def register_for(self, destination):
+        # Where to compute a result headed for destination
+        return '%rax' if is_memory(destination) else destination
+
+    def element(self, array, index):
+        # Memory operand for array[index]
+        if array in self.arrays:
+            base = self.arrays[array]
+            if isinstance(index, int):
+                return f"{base + 8 * index}(%rbp)"
+            return f"{base}(%rbp,{self.index_register(index)},8)"
+        if isinstance(index, int):
+            return f"{global_symbol(array)}+{8 * index}(%rip)"
+        self.emit(f"leaq {global_symbol(array)}(%rip), %rax")
+        return f"(%rax,{self.index_register(index)},8)"
+
+    def index_register(self, index):
+        location = self.operand(index)
+        if is_memory(location):
+            self.emit(f"movq {location}, %r11")
+            return '%r11'
+        return location
+
+    def generate_return(self, quad):
+        if self.return_types.get(self.function) == 'double':
+            self.load_double(quad.arg1, '%xmm0')
+        else:
+            self.load(quad.arg1, '%rax')
+
+    def generate_call(self, quad):
+        emit = self.emit
+        types = self.signatures.get(quad.arg1, [])
+        args = list(quad.arg2)
+        registers = assign_arguments(types)
+        stack_args = [(arg, type) for arg, type, register in zip(args, types, registers) if register is None]
+        padding = 8 * (len(stack_args) % 2)
+        if padding:
+            emit(f"subq ${padding}, %rsp")
+        for arg, type in reversed(stack_args):
+            if type == 'double':
+                self.load_double(arg, '%xmm0')
+                emit("subq $8, %rsp")
+                emit("movsd %xmm0, (%rsp)")
+            else:
+                emit(f"pushq {self.value(arg)}")
+        moves = []
+        for arg, register in zip(args, registers):
+            if register is None:
+                continue
+            if register.startswith('%xmm'):
+                self.load_double(arg, register)
+            else:
+                moves.append((arg if isinstance(arg, int) else self.operand(arg), register))
+        self.parallel_move(moves)
+        emit(f"call {function_symbol(quad.arg1)}")
+        if stack_args:
+            emit(f"addq ${8 * len(stack_args) + padding}, %rsp")
+        if self.return_types.get(quad.arg1) == 'double':
+            self.store_double('%xmm0', quad.result)
+        else:
+            self.move('%rax', self.location(quad.result))
+
+    def generate_double(self, quad):
+        op = quad.op
+        self.load_double(quad.arg1, '%xmm0')
+        self.load_double(quad.arg2, '%xmm1')
+        if op in SSE_OPERATORS:
+            self.emit(f"{SSE_OPERATORS[op]} %xmm1, %xmm0")
+            self.store_double('%xmm0', quad.result)
+        else:
+            destination = self.location(quad.result)
+            target = self.register_for(destination)
+            swapped, condition, parity, combine = SSE_SET_CONDITION[op]
+            self.emit("ucomisd %xmm0, %xmm1" if swapped else "ucomisd %xmm1, %xmm0")
+            self.emit(f"{condition} %al")
+            if parity is not None:
+                self.emit(f"{parity} %r11b")
+                self.emit(f"{combine} %r11b, %al")
+            self.emit(f"movzbq %al, {target}")
+            self.move(target, destination)
+
+    def generate_quad(self, quad):
+        emit = self.emit
+        op = quad.op
+        if op in SSE_OPERATORS or op in SSE_SET_CONDITION:
+            if 'double' in (quad.type, self.type_of(quad.arg1), self.type_of(quad.arg2)):
+                self.generate_double(quad)
+                return
+        if op in ASM_OPERATORS:
+            destination = self.location(quad.result)
+            left = self.value(quad.arg1, '%rax')
+            right = self.value(quad.arg2, '%r11')
+            target = self.register_for(destination)
+            if target == right and target != left:
+                if op in COMMUTATIVE_ASM:
+                    left, right = right, left
+                else:
+                    target = '%rax'
+            self.move(left, target)
+            emit(f"{ASM_OPERATORS[op]} {right}, {target}")
+            self.move(target, destination)
+        elif op in ASM_SET_CONDITION:
+            destination = self.location(quad.result)
+            left = self.value(quad.arg1, '%rax')
+            right = self.value(quad.arg2, '%r11')
+            if left.startswith('$') or (is_memory(left) and is_memory(right)):
+                self.move(left, '%rax')
+                left = '%rax'
+            emit(f"cmpq {right}, {left}")
+            emit(f"{ASM_SET_CONDITION[op]} %al")
+            target = self.register_for(destination)
+            emit(f"movzbq %al, {target}")
+            self.move(target, destination)
+        elif op in (Op.DIV, Op.MOD):
+            destination = self.location(quad.result)
+            self.move(self.value(quad.arg1, '%rax'), '%rax')
+            divisor = self.value(quad.arg2, '%r11')
+            if divisor.startswith('$'):
+                emit(f"movq {divisor}, %r11")
+                divisor = '%r11'
+            emit("cqto")
+            emit(f"idivq {divisor}")
+            self.move('%rdx' if op == Op.MOD else '%rax', destination)
+        elif op == Op.NOT:
+            destination = self.location(quad.result)
+            target = self.register_for(destination)
+            self.move(self.value(quad.arg1, target), target)
+            emit(f"xorq $1, {target}")
+            self.move(target, destination)
+        elif op == Op.COPY:
+            if 'double' in (self.type_of(quad.result), self.type_of(quad.arg1)):
+                self.load_double(quad.arg1, '%xmm0')
+                self.store_double('%xmm0', quad.result)
+            else:
+                self.load(quad.arg1, self.location(quad.result))
+        elif op == Op.LOAD:
+            destination = self.location(quad.result)
+            target = self.register_for(destination)
+            emit(f"movq {self.element(quad.arg1, quad.arg2)}, {target}")
+            self.move(target, destination)
+        elif op == Op.STORE:
+            if quad.type == 'double':
+                self.load_double(quad.arg2, '%xmm0')
+                emit(f"movsd %xmm0, {self.element(quad.result, quad.arg1)}")
+                return
+            value = self.value(quad.arg2, '%rdx')
+            if is_memory(value):
+                emit(f"movq {value}, %rdx")
+                value = '%rdx'
+            emit(f"movq {value}, {self.element(quad.result, quad.arg1)}")
+        elif op == Op.CALL:
+            self.generate_call(quad)
+        elif op == Op.PRINT:
+            if self.type_of(quad.arg1) == 'double' or quad.type == 'double':
+                self.load_double(quad.arg1, '%xmm0')
+                emit("call print_double")
+            else:
+                self.load(quad.arg1, '%rdi')
+                emit("call print")
+        elif op == Op.LABEL:
+            self.emit_label(self.label(quad.arg1))
+        elif op == Op.GOTO:
+            emit(f"jmp {self.label(quad.arg1)}")
+        elif op == Op.IF_FALSE:
+            if isinstance(quad.arg1, (int, float)):
+                if not quad.arg1:
+                    emit(f"jmp {self.label(quad.arg2)}")
+            else:
+                emit(f"cmpq $0, {self.operand(quad.arg1)}")
+                emit(f"je {self.label(quad.arg2)}")
+        elif op in (Op.FUNC, Op.PARAM, Op.ALLOC):
+            pass
+        else:
+            tracer.error("No assembly template for %s", quad)
@@ -0,0 +1,165 @@
+# Typed AST nodes. Every construct has its own class with fixed fields held in
+# __slots__, so nodes carry no per-instance __dict__. `fields` lists the slots in
+# display order and `kind` names the code generator's handle_<kind> method.
+
+class Node:
+    __slots__ = ()
+    fields = ()
+    kind = 'node'
+
+    def __init__(self, *args):
+        for position, name in enumerate(self.fields):
+            setattr(self, name, args[position] if position < len(args) else None)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, name) == getattr(other, name) for name in self.fields)
+
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(repr(getattr(self, name)) for name in self.fields)})"
+
+
+class Program(Node):
+    __slots__ = fields = ('functions', 'declarations', 'statements')
+    kind = 'program'
+
+
+class FuncDef(Node):
+    __slots__ = fields = ('return_type', 'name', 'params', 'declarations', 'body')
+    kind = 'fdec'
+
+
+class Param(Node):
+    __slots__ = fields = ('type', 'name')
+    kind = 'param'
+
+
+class Decl(Node):
+    __slots__ = fields = ('type', 'vars')
+    kind = 'decl'
+
+
+class Assign(Node):
+    __slots__ = fields = ('target', 'expr')
+    kind = 'assignment'
+
+
+class If(Node):
+    __slots__ = fields = ('cond', 'then_body', 'else_body')
+    kind = 'if'
+
+
+class While(Node):
+    __slots__ = fields = ('cond', 'body')
+    kind = 'while'
+
+
+class Return(Node):
+    __slots__ = fields = ('expr',)
+    kind = 'return'
+
+
+class Print(Node):
+    __slots__ = fields = ('expr',)
+    kind = 'print'
+
+
+class BinOp(Node):
+    __slots__ = fields = ('op', 'left', 'right')
+    kind = 'binop'
+
+
+class Call(Node):
+    __slots__ = fields = ('name', 'args')
+    kind = 'call'
+
+
+class Var(Node):
+    __slots__ = fields = ('name', 'index')
+    kind = 'var'
+
+
+class Number(Node):
+    __slots__ = fields = ('value', 'type')
+    kind = 'number'
+
+
+class Compare(Node):
+    __slots__ = fields = ('op', 'left', 'right')
+    kind = 'comp'
+
+
+class BoolOp(Node):
+    __slots__ = fields = ('op', 'operands')
+    kind = 'boolop'
+
+
+class Not(Node):
+    __slots__ = fields = ('operand',)
+    kind = 'not'
+
+
+BOOLEAN_NODES = (Compare, BoolOp, Not)
+
+# Operators that chain at the same level: a - b + c parses as (a - b) + c
+PRECEDENCE = {'+': 0, '-': 0, '*': 1, '/': 1, '%': 1}
+
+
+def walk(node):
+    # Every node of a tree, parents before children, without recursion
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        yield item
+        for name in item.fields:
+            value = getattr(item, name)
+            if isinstance(value, Node):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(child for child in value if isinstance(child, Node))
+
+
+def binop_chain(node):
+    # The operators and operands of a left-nested chain of same-level BinOps,
+    # in source order
+    ops, operands = [], []
+    level = PRECEDENCE.get(node.op)
+    while type(node) is BinOp and PRECEDENCE.get(node.op) == level:
+        ops.append(node.op)
+        operands.append(node.right)
+        node = node.left
+    operands.append(node)
+    return ops[::-1], operands[::-1]
+
+
+def dump(node, indent=0, file=None):
+    # Print a node and its subtrees, one node per line, for ast_output.txt. Uses
+    # an explicit stack so long left-nested operator chains don't hit the
+    # recursion limit, and prints such a chain like an and/or, all its operands
+    # at one depth, so the output does not grow with the square of its length.
+    stack = [(node, indent)]
+    while stack:
+        item, indent = stack.pop()
+        if isinstance(item, str):
+            print(item, file=file)
+            continue
+        pad = '  ' * indent
+        if type(item) is BinOp and type(item.left) is BinOp and PRECEDENCE.get(item.left.op) == PRECEDENCE.get(item.op):
+            ops, operands = binop_chain(item)
+            operands = [operand for operand in operands if isinstance(operand, Node)]
+            print(f"{pad}BinOp op={' '.join(ops)}", file=file)
+            stack.extend(reversed([(f"{pad}  operands: [{len(operands)}]", None)] + [(operand, indent + 2) for operand in operands]))
+            continue
+        scalars = [f"{name}={getattr(item, name)}" for name in item.fields if not isinstance(getattr(item, name), (Node, list))]
+        print(f"{pad}{type(item).__name__} {' '.join(scalars)}".rstrip(), file=file)
+        children = []
+        for name in item.fields:
+            value = getattr(item, name)
+            if isinstance(value, Node):
+                children.append((f"{pad}  {name}:", None))
+                children.append((value, indent + 2))
+            elif isinstance(value, list):
+                children.append((f"{pad}  {name}: [{len(value)}]", None))
+                children.extend((child, indent + 2) for child in value if isinstance(child, Node))
+        stack.extend(reversed(children))
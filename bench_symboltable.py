@@ -0,0 +1,43 @@
+import sys
+import time
+
+from symboltable import SymbolTable
+
+# Lookup throughput from inside `depth` nested while/if scopes. The binding stacks
+# should give the same rate at every depth; walking the parent chain of the current
+# scope (lookup(name, scope)) is shown alongside for comparison.
+
+GLOBALS = 1000
+LOOKUPS = 200000
+
+
+def build_table(depth):
+    table = SymbolTable()
+    for index in range(GLOBALS):
+        table.insert(1, f"g{index}", 'ID', 'int')
+    table.add_function('f', 'int', [], ('DEF', 'def', 1, 1))
+    table.insert(1, 'x', 'ID', 'int')
+    for level in range(depth):
+        table.enter_scope('block')
+    return table
+
+
+def measure(lookup, names):
+    start = time.perf_counter()
+    for name in names:
+        lookup(name)
+    return len(names) / (time.perf_counter() - start)
+
+
+def main(depths=(1, 10, 100, 1000)):
+    names = [sys.intern(f"g{index % GLOBALS}") if index % 2 else 'x' for index in range(LOOKUPS)]
+    print(f"{'depth':>6} {'bindings/s':>14} {'parent walk/s':>14}")
+    for depth in depths:
+        table = build_table(depth)
+        fast = measure(table.lookup, names)
+        slow = measure(lambda name: table.lookup(name, table.current_scope), names[:LOOKUPS // 10])
+        print(f"{depth:>6} {fast:>14,.0f} {slow:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from tracing import get_tracer
+
+tracer = get_tracer('cache')
+
+CACHE_FORMAT = 1
+HASH_CHUNK = 1 << 20
+COMPILER_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+_fingerprint = None
+
+
+def compiler_fingerprint():
+    # Hash of the compiler's own sources, so editing any module invalidates
+    # every entry built by the old code
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256(f"format {CACHE_FORMAT}".encode())
+        for path in sorted(glob.glob(os.path.join(COMPILER_DIRECTORY, '*.py'))):
+            digest.update(os.path.basename(path).encode())
+            with open(path, 'rb') as file:
+                digest.update(hashlib.sha256(file.read()).digest())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+def default_cache_directory():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'cp-compiler')
+
+
+class CompilationCache:
+    # Content-addressed store of compiler outputs. An entry is keyed by the
+    # sha256 of the source text, the compiler fingerprint and the options, and
+    # holds every output file's text plus the error list as one JSON file under
+    # <directory>/<first two hex digits>/<key>.
+    #
+    # Several driver processes may share a directory: entries are written to a
+    # temporary file and renamed into place, so readers see a whole entry or
+    # none, and a reader that loses a race with eviction just misses. A hit
+    # touches the entry's mtime, which makes evict() least recently used first;
+    # evict() runs under an exclusive lock so concurrent drivers do not both
+    # trim the same entries.
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, source, options=()):
+        # source is the text or bytes, or a file read to its end a chunk at a
+        # time; a text file gives the same key as its text
+        digest = hashlib.sha256(compiler_fingerprint().encode())
+        digest.update(repr(sorted(options)).encode())
+        if hasattr(source, 'read'):
+            chunk = source.read(HASH_CHUNK)
+            while chunk:
+                digest.update(chunk.encode() if isinstance(chunk, str) else chunk)
+                chunk = source.read(HASH_CHUNK)
+        else:
+            digest.update(source.encode() if isinstance(source, str) else source)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'r') as file:
+                entry = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        tracer.debug("Cache hit %s", key)
+        return entry
+
+    def put(self, key, entry):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(descriptor, 'w') as file:
+                json.dump(entry, file)
+            os.replace(temporary, path)
+        except BaseException:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            raise
+        tracer.debug("Cache store %s", key)
+
+    def entries(self):
+        # (mtime, size, path) of every entry currently on disk
+        found = []
+        for path in glob.glob(os.path.join(self.directory, '??', '*')):
+            try:
+                status = os.stat(path)
+            except OSError:
+                continue
+            found.append((status.st_mtime, status.st_size, path))
+        return found
+
+    def evict(self):
+        # Removes least recently used entries until the cache fits in max_bytes
+        if not os.path.isdir(self.directory):
+            return 0
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = sorted(self.entries())
+            total = sum(size for mtime, size, path in entries)
+            removed = 0
+            for mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        tracer.debug("Evicted %d cache entries, %d bytes left", removed, total)
+        return removed
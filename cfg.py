@@ -0,0 +1,283 @@
+from ir import Op, DEFINING_OPS, split_blocks, operands
+
+# Per-function control-flow graphs over the quads from IntermediateCodeGenerator.
+# Dominators use the Cooper-Harvey-Kennedy iterative algorithm over reverse
+# postorder, which converges in a couple of passes for the reducible graphs that
+# if/while produce. Natural loops come from back edges (tail -> header where the
+# header dominates the tail) and are only worked out when first asked for.
+
+
+class Loop:
+    # own holds the blocks whose innermost loop this is; blocks, every block in
+    # the loop including those of the loops nested in it, is built on first use
+    __slots__ = ('header', 'own', 'children', 'size', 'parent', 'depth', 'body')
+
+    def __init__(self, header):
+        self.header = header
+        self.own = [header]
+        self.children = []
+        self.size = 1
+        self.parent = None
+        self.depth = 1
+        self.body = None
+
+    @property
+    def blocks(self):
+        if self.body is None:
+            self.body = set()
+            stack = [self]
+            while stack:
+                loop = stack.pop()
+                self.body.update(loop.own)
+                stack.extend(loop.children)
+        return self.body
+
+    def __repr__(self):
+        return f"Loop(header={self.header.index}, blocks={sorted(block.index for block in self.blocks)}, depth={self.depth})"
+
+
+class ControlFlowGraph:
+
+    def __init__(self, quads):
+        self.name = quads[0].arg1 if quads and quads[0].op == Op.FUNC else None
+        self.blocks = split_blocks(quads)
+        self.entry = self.blocks[0] if self.blocks else None
+        self.label_blocks = {block.label: block for block in self.blocks if block.label is not None}
+        self.link_blocks()
+        self.rpo = self.reverse_postorder()
+        self.idom = {}
+        self.dom_children = {}
+        self.dom_pre = {}
+        self.dom_post = {}
+        self.nest = None
+        self.compute_dominators()
+
+    def link_blocks(self):
+        blocks = self.blocks
+        for position, block in enumerate(blocks):
+            last = block.quads[-1]
+            targets = []
+            if last.op == Op.GOTO:
+                targets.append(self.label_blocks[last.arg1])
+            elif last.op == Op.RETURN:
+                pass
+            else:
+                if last.op == Op.IF_FALSE:
+                    targets.append(self.label_blocks[last.arg2])
+                if position + 1 < len(blocks):
+                    targets.append(blocks[position + 1])
+            for target in targets:
+                if target not in block.succs:
+                    block.succs.append(target)
+                    target.preds.append(block)
+
+    def reverse_postorder(self):
+        if self.entry is None:
+            return []
+        order = []
+        visited = {self.entry}
+        stack = [(self.entry, iter(self.entry.succs))]
+        while stack:
+            block, successors = stack[-1]
+            for succ in successors:
+                if succ not in visited:
+                    visited.add(succ)
+                    stack.append((succ, iter(succ.succs)))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+        order.reverse()
+        return order
+
+    def reachable(self, block):
+        return block in self.idom
+
+    def compute_dominators(self):
+        if self.entry is None:
+            return
+        rpo_number = {block: number for number, block in enumerate(self.rpo)}
+        idom = {self.entry: self.entry}
+
+        def intersect(first, second):
+            while first is not second:
+                while rpo_number[first] > rpo_number[second]:
+                    first = idom[first]
+                while rpo_number[second] > rpo_number[first]:
+                    second = idom[second]
+            return first
+
+        changed = True
+        while changed:
+            changed = False
+            for block in self.rpo[1:]:
+                new_idom = None
+                for pred in block.preds:
+                    if pred in idom:
+                        new_idom = pred if new_idom is None else intersect(pred, new_idom)
+                if idom.get(block) is not new_idom:
+                    idom[block] = new_idom
+                    changed = True
+        self.idom = idom
+
+        # Number the dominator tree so dominates() is two comparisons
+        self.dom_children = {block: [] for block in self.rpo}
+        for block in self.rpo[1:]:
+            self.dom_children[idom[block]].append(block)
+        counter = 0
+        stack = [(self.entry, False)]
+        while stack:
+            block, finished = stack.pop()
+            if finished:
+                self.dom_post[block] = counter
+                counter += 1
+                continue
+            self.dom_pre[block] = counter
+            counter += 1
+            stack.append((block, True))
+            stack.extend((child, False) for child in reversed(self.dom_children[block]))
+
+    def dominates(self, first, second):
+        if first not in self.dom_pre or second not in self.dom_pre:
+            return False
+        return self.dom_pre[first] <= self.dom_pre[second] and self.dom_post[second] <= self.dom_post[first]
+
+    @property
+    def loops(self):
+        # Outermost first
+        if self.nest is None:
+            self.nest = self.find_loops()
+        return self.nest[0]
+
+    @property
+    def loop_of(self):
+        # Block -> innermost loop containing it
+        if self.nest is None:
+            self.nest = self.find_loops()
+        return self.nest[1]
+
+    def find_loops(self):
+        # All loops in one pass. The back edges into a header share one loop.
+        # Headers are handled innermost first (an inner header comes later in
+        # the dominator tree's preorder), each walking back from its back edges;
+        # a finished inner loop is collapsed into its header with union-find, so
+        # an outer loop steps over it in one move and every block and edge is
+        # looked at about once, however deep the nesting.
+        headers = {}
+        for block in self.rpo:
+            for succ in block.succs:
+                if self.dominates(succ, block):
+                    headers.setdefault(succ, []).append(block)
+        loop_of = {}
+        collapsed = {}
+
+        def find(block):
+            root = block
+            while root in collapsed:
+                root = collapsed[root]
+            while block is not root:
+                collapsed[block], block = root, collapsed[block]
+            return root
+
+        for header in sorted(headers, key=self.dom_pre.get, reverse=True):
+            loop = loop_of[header] = Loop(header)
+            work = list(headers[header])
+            while work:
+                block = find(work.pop())
+                if block is header or not self.reachable(block):
+                    continue
+                inner = loop_of.get(block)
+                if inner is not None and inner.header is block:
+                    inner.parent = loop
+                    loop.children.append(inner)
+                    loop.size += inner.size
+                else:
+                    loop_of[block] = loop
+                    loop.own.append(block)
+                    loop.size += 1
+                collapsed[block] = header
+                work.extend(block.preds)
+
+        # Parents come before their children in the dominator tree's preorder
+        for header in sorted(headers, key=self.dom_pre.get):
+            loop = loop_of[header]
+            if loop.parent is not None:
+                loop.depth = loop.parent.depth + 1
+        # An outer loop is larger than the loops it contains, so this lists it first
+        loops = sorted((loop_of[header] for header in headers), key=lambda loop: -loop.size)
+        return loops, loop_of
+
+    def loop_depth(self, block):
+        loop = self.loop_of.get(block)
+        return loop.depth if loop is not None else 0
+
+    def liveness(self, exit_live=frozenset(), call_live=frozenset()):
+        # Backward data flow: the names live on entry to and exit from each
+        # block. exit_live is live wherever control leaves the function and
+        # call_live at every call (a callee may read it).
+        live_in = {block: set() for block in self.blocks}
+        live_out = {block: set() for block in self.blocks}
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(self.rpo):
+                live = set(exit_live) if not block.succs else set()
+                for succ in block.succs:
+                    live |= live_in[succ]
+                live_out[block] = set(live)
+                for quad in reversed(block.quads):
+                    transfer_liveness(quad, live, call_live)
+                if live != live_in[block]:
+                    live_in[block] = live
+                    changed = True
+        return live_in, live_out
+
+    def quads(self):
+        return [quad for block in self.blocks for quad in block.quads]
+
+    def display(self, file=None):
+        print(f"CFG for {self.name}:", file=file)
+        for block in self.blocks:
+            idom = self.idom.get(block)
+            print(f"  B{block.index} label={block.label} preds={[pred.index for pred in block.preds]} "
+                  f"succs={[succ.index for succ in block.succs]} "
+                  f"idom={idom.index if idom is not None and block is not self.entry else None} "
+                  f"loop_depth={self.loop_depth(block)}", file=file)
+        for loop in self.loops:
+            print(f"  {loop!r}", file=file)
+
+
+def transfer_liveness(quad, live, call_live=frozenset()):
+    # Steps live backwards over quad
+    if quad.op in DEFINING_OPS:
+        live.discard(quad.result)
+    if quad.op == Op.CALL:
+        live |= call_live
+    for operand in operands(quad):
+        if isinstance(operand, str):
+            live.add(operand)
+
+
+def split_functions(quads):
+    # Returns the global ALLOCs ahead of the first FUNC and one quad list per function
+    globals_end = 0
+    while globals_end < len(quads) and quads[globals_end].op != Op.FUNC:
+        globals_end += 1
+    functions = []
+    for quad in quads[globals_end:]:
+        if quad.op == Op.FUNC:
+            functions.append([])
+        functions[-1].append(quad)
+    return quads[:globals_end], functions
+
+
+def build_cfgs(quads):
+    global_quads, functions = split_functions(quads)
+    return global_quads, [ControlFlowGraph(function) for function in functions]
+
+
+def join_cfgs(global_quads, cfgs):
+    quads = list(global_quads)
+    for graph in cfgs:
+        quads.extend(graph.quads())
+    return quads
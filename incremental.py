@@ -0,0 +1,280 @@
+from collections import Counter
+
+from astnodes import Program, FuncDef
+from keywords import FOLLOW
+from lexer import Lexer
+from parser import Parser
+from pipeline import FunctionCompiler, compile_functions, outline
+from symboltable import Scope, SymbolTable
+from tracing import get_tracer
+
+tracer = get_tracer('incremental')
+
+BLOCK = 4096
+
+
+def common_prefix(first, second):
+    # Length of the longest common prefix, compared a block at a time and then
+    # narrowed down by halving inside the first block that differs
+    limit = min(len(first), len(second))
+    size = 0
+    while size + BLOCK <= limit and first[size:size + BLOCK] == second[size:size + BLOCK]:
+        size += BLOCK
+    block = BLOCK
+    while block:
+        if size + block <= limit and first[size:size + block] == second[size:size + block]:
+            size += block
+        block //= 2
+    return size
+
+
+def common_suffix(first, second, limit):
+    # Length of the longest common suffix, at most limit
+    size = 0
+    while size + BLOCK <= limit and first[len(first) - size - BLOCK:len(first) - size] == second[len(second) - size - BLOCK:len(second) - size]:
+        size += BLOCK
+    block = BLOCK
+    while block:
+        if (size + block <= limit and
+                first[len(first) - size - block:len(first) - size] == second[len(second) - size - block:len(second) - size]):
+            size += block
+        block //= 2
+    return size
+
+
+def copy_scope(scope, parent, offset):
+    # A copy of a scope tree with every symbol's line moved by offset
+    copy = Scope(scope.kind, parent)
+    copy.symbols = {lexeme: dict(entry, line=entry['line'] + offset) for lexeme, entry in scope.symbols.items()}
+    copy.children = [copy_scope(child, copy, offset) for child in scope.children]
+    return copy
+
+
+def array_size(var):
+    # What the code generator reads from a global's [size]
+    if var.index is None or var.index.kind != 'number':
+        return var.index and var.index.kind
+    return var.index.type, var.index.value
+
+
+class Region:
+    # One 'def ... fed ;' declaration or, last in a program, everything after
+    # the declarations. start and end are offsets into the current text and
+    # line is the line the region starts on. tokens, node and symbols are what
+    # its own lexer and parser produced when the region was last parsed, at
+    # parsed_line; the token line numbers are not moved along with the region.
+    # signature is what the region adds to the environment every function is
+    # compiled in, and code its FunctionCode, or None until generated.
+    __slots__ = ('start', 'end', 'line', 'parsed_line', 'tokens', 'node', 'symbols', 'signature', 'code')
+
+    def __init__(self, start, end, tokens, node, symbols):
+        self.start = start
+        self.end = end
+        self.line = self.parsed_line = tokens[0][2]
+        self.tokens = tokens
+        self.node = node
+        self.symbols = symbols
+        if isinstance(node, FuncDef):
+            self.signature = (node.name, node.return_type, tuple(param.type for param in node.params))
+        else:
+            self.signature = tuple((var.name, decl.type, array_size(var)) for decl in node.declarations for var in decl.vars)
+        self.code = None
+
+
+class IncrementalCompiler:
+    # Recompiles a program after each edit, redoing as little as it can. The
+    # text is kept as a list of regions, one per function declaration plus the
+    # program body. An update relexes only from the end of the last region
+    # before the edit until the lexer reaches a token that starts an unchanged
+    # region after it; from there on the old tokens are still right. Only the
+    # regions in between are parsed again, each with a parser of its own, and
+    # their nodes are spliced into the program. A function's IR is generated
+    # and assembled again when its region was reparsed or the environment it
+    # is compiled in, the globals and the function signatures, changed; the
+    # FunctionCompiler holding that environment is kept between updates.
+    #
+    # Whenever the regions cannot be trusted to parse the way the whole program
+    # would (lexer, syntax or symbol table errors, or a region that does not
+    # end where its 'fed ;' is) the text is compiled from scratch instead, so
+    # the errors always read the same as compile_source's. The next update
+    # after that starts over from a full lex.
+    def __init__(self):
+        self.text = ''
+        self.regions = []
+        self.environment = None
+        self.compiler = None
+        self.front_end = None
+        self.program = None
+        self.quads = None
+        self.asm_code = None
+        self.errors = []
+        self.stats = Counter()
+
+    def update(self, text):
+        # Compiles text, the whole new source, and returns its errors
+        regions = self.split(text)
+        self.text = text
+        if regions is None:
+            self.regions = []
+            self.environment = None
+            self.compiler = None
+            self.compile_all(text)
+        else:
+            self.regions = regions
+            self.front_end = None
+            self.generate()
+        return self.errors
+
+    def split(self, text):
+        # The regions of text, reusing the unchanged ones, or None
+        old, regions = self.text, self.regions
+        prefix = common_prefix(old, text) if regions else 0
+        if regions and prefix == len(old) == len(text):
+            return regions
+        suffix = common_suffix(old, text, min(len(old), len(text)) - prefix) if regions else 0
+        old_end, new_end = len(old) - suffix, len(text) - suffix
+        delta = len(text) - len(old)
+
+        # Regions entirely before the edit stay as they are. The program body
+        # runs to the end of the text, so it never does.
+        first = 0
+        while first < len(regions) - 1 and regions[first].end <= prefix:
+            first += 1
+        resume = first
+        while resume < len(regions) and regions[resume].start < old_end:
+            resume += 1
+
+        start = regions[first - 1].end if first else 0
+        lexer = Lexer(text[start:])
+        lexer.line = text.count('\n', 0, start) + 1
+        lexer.line_start = text.rfind('\n', 0, start) + 1 - start
+        tokens, offsets = [], []
+        synced = None
+        for token_type, lexeme, offset in lexer.scan():
+            # Stop at the first token that starts an unchanged region
+            while resume < len(regions) and regions[resume].start + delta < offset + start:
+                resume += 1
+            if resume < len(regions) and regions[resume].start + delta == offset + start:
+                synced = resume
+                break
+            tokens.append((token_type, lexeme, lexer.line, offset - lexer.line_start + 1))
+            offsets.append(offset + start)
+        self.stats['tokens relexed'] += len(tokens)
+        if lexer.errors:
+            return None
+
+        parsed = []
+        position = 0
+        while position < len(tokens) and tokens[position][0] == 'DEF':
+            end = position + 1
+            while end + 1 < len(tokens) and tokens[end][0] != 'DEF' and not (tokens[end][0] == 'FED' and tokens[end + 1][0] == 'SEMICOLON'):
+                end += 1
+            if end + 1 >= len(tokens) or tokens[end][0] != 'FED':
+                return None
+            region = self.parse_function(tokens[position:end + 2], offsets[position], offsets[end + 1] + 1)
+            if region is None:
+                return None
+            parsed.append(region)
+            position = end + 2
+        if synced is None:
+            body = self.parse_body(tokens[position:], offsets[position] if position < len(tokens) else len(text), len(text))
+            if body is None:
+                return None
+            parsed.append(body)
+            following = []
+        elif position < len(tokens):
+            return None
+        else:
+            following = regions[synced:]
+            line_delta = text.count('\n', prefix, new_end) - old.count('\n', prefix, old_end)
+            for region in following:
+                region.start += delta
+                region.end += delta
+                region.line += line_delta
+        self.stats['regions reparsed'] += len(parsed)
+
+        regions = regions[:first] + parsed + following
+        names = [region.node.name for region in regions[:-1]]
+        if len(set(names)) != len(names):
+            return None
+        tracer.debug("Relexed %d tokens, reparsed %d of %d regions", len(tokens), len(parsed), len(regions))
+        return regions
+
+    def parse_function(self, tokens, start, end):
+        # A region for 'def ... fed ;', provided it parses on its own without
+        # errors and up to exactly its last token
+        parser = Parser(tokens, None)
+        node = parser.parse_fdec()
+        parser.match_terminal('SEMICOLON', '<fdecls>')
+        if parser.errors or parser.symbol_table.errors or not parser.reached_end_of_input or parser.position != len(tokens) - 1:
+            return None
+        return Region(start, end, tokens, node, parser.symbol_table)
+
+    def parse_body(self, tokens, start, end):
+        # A region for the declarations and statements of the program body
+        if not tokens or tokens[0][0] not in FOLLOW['<fdecls\'>']:
+            return None
+        parser = Parser(tokens, None)
+        node = parser.parse_program_body([])
+        if parser.errors or parser.symbol_table.errors:
+            return None
+        return Region(start, end, tokens, node, parser.symbol_table)
+
+    def generate(self):
+        functions = [region.node for region in self.regions[:-1]]
+        body = self.regions[-1].node
+        self.program = Program(functions, body.declarations, body.statements)
+        environment = tuple(region.signature for region in self.regions)
+        if environment != self.environment:
+            self.environment = environment
+            for region in self.regions:
+                region.code = None
+            self.compiler = FunctionCompiler(outline(self.program))
+
+        for region in self.regions:
+            if region.code is None:
+                region.code = self.compiler.compile(region.node if isinstance(region.node, FuncDef) else region.node.statements)
+                self.stats['functions regenerated'] += 1
+        self.errors = self.compiler.errors + [error for region in self.regions for error in region.code.errors]
+        self.quads = None
+        if not self.errors:
+            self.quads = self.compiler.global_quads + [quad for region in self.regions for quad in region.code.quads]
+
+    def compile_all(self, text):
+        # The whole pipeline over text, as compile_source runs it
+        lexer = Lexer(text)
+        # Kept until the next update for tokens(), so stored compactly
+        tokens = lexer.compact_tokens()
+        parser = Parser(tokens, lexer)
+        self.program = parser.parse()
+        self.front_end = (tokens, parser.symbol_table)
+        self.quads = self.asm_code = None
+        self.errors = lexer.errors + parser.errors + parser.symbol_table.errors
+        self.stats['full compiles'] += 1
+        if not self.errors:
+            self.quads, self.asm_code, self.errors = compile_functions(self.program)
+
+    def tokens(self):
+        if self.front_end is not None:
+            return self.front_end[0]
+        return [token for region in self.regions for token in region.tokens]
+
+    def symbol_table(self):
+        # The parser's symbol table for the whole text, with each region's
+        # symbols moved to the lines the region is on now
+        if self.front_end is not None:
+            return self.front_end[1]
+        table = SymbolTable()
+        for region in self.regions:
+            scope = copy_scope(region.symbols.global_scope, None, region.line - region.parsed_line)
+            table.global_scope.symbols.update(scope.symbols)
+            for child in scope.children:
+                child.parent = table.global_scope
+                table.global_scope.children.append(child)
+        return table
+
+    def assembly(self):
+        # Assembly lines for the last error-free update
+        if self.front_end is not None:
+            return self.asm_code
+        return self.compiler.assembler.link([(region.code.asm_code, region.code.constants) for region in self.regions])
@@ -0,0 +1,178 @@
+from enum import IntEnum
+
+# Three-address code. A program is a flat list of Quads: ALLOCs for the globals,
+# then one FUNC quad per function followed by its body, the program body last as
+# function 'main'.
+# Operands are variable names (str), temporaries (Temp) or int/float constants.
+#
+#   FUNC      arg1=name, type=returns    PARAM   result=name, type
+#   LABEL     arg1=label                 ALLOC   result=name, arg1=size or None, type
+#   COPY      result = arg1              LOAD    result = arg1[arg2]
+#   STORE     result[arg1] = arg2        NOT     result = not arg1
+#   ADD..NE   result = arg1 op arg2      CALL    result = call arg1(*arg2)
+#   GOTO      arg1=label                 IF_FALSE if not arg1 goto arg2
+#   RETURN    arg1                       PRINT   arg1
+
+
+class Op(IntEnum):
+    FUNC = 0
+    LABEL = 1
+    PARAM = 2
+    ALLOC = 3
+    COPY = 4
+    LOAD = 5
+    STORE = 6
+    ADD = 7
+    SUB = 8
+    MUL = 9
+    DIV = 10
+    MOD = 11
+    LT = 12
+    LE = 13
+    GT = 14
+    GE = 15
+    EQ = 16
+    NE = 17
+    NOT = 18
+    CALL = 19
+    GOTO = 20
+    IF_FALSE = 21
+    RETURN = 22
+    PRINT = 23
+
+
+BINARY_OPS = {'+': Op.ADD, '-': Op.SUB, '*': Op.MUL, '/': Op.DIV, '%': Op.MOD,
+              '<': Op.LT, '<=': Op.LE, '>': Op.GT, '>=': Op.GE, '==': Op.EQ, '<>': Op.NE}
+OP_SYMBOLS = {op: symbol for symbol, op in BINARY_OPS.items()}
+ARITHMETIC_OPS = frozenset((Op.ADD, Op.SUB, Op.MUL, Op.DIV, Op.MOD))
+COMPARISON_OPS = frozenset((Op.LT, Op.LE, Op.GT, Op.GE, Op.EQ, Op.NE))
+JUMP_OPS = frozenset((Op.GOTO, Op.IF_FALSE, Op.RETURN))
+
+# Fields each opcode reads as scalar operands (CALL also reads every arg in arg2)
+# and the opcodes whose result field is a scalar they assign
+OPERAND_FIELDS = {op: ('arg1', 'arg2') for op in OP_SYMBOLS}
+OPERAND_FIELDS.update({Op.COPY: ('arg1',), Op.NOT: ('arg1',), Op.LOAD: ('arg2',), Op.STORE: ('arg1', 'arg2'),
+                       Op.IF_FALSE: ('arg1',), Op.RETURN: ('arg1',), Op.PRINT: ('arg1',)})
+DEFINING_OPS = frozenset(OP_SYMBOLS) | {Op.COPY, Op.NOT, Op.LOAD, Op.CALL}
+
+
+class Temp(str):
+    # Compiler-generated temporary; compares and hashes like its name
+    __slots__ = ()
+
+
+class Quad:
+    # Passes rewrite quads in place and hold on to them (block lists, hoisted
+    # code), so each is an object of its own; __slots__ keeps one smaller than a
+    # tuple of the same five fields
+    __slots__ = ('op', 'result', 'arg1', 'arg2', 'type')
+
+    def __init__(self, op, result=None, arg1=None, arg2=None, type=None):
+        self.op = op
+        self.result = result
+        self.arg1 = arg1
+        self.arg2 = arg2
+        self.type = type
+
+    def __eq__(self, other):
+        return (isinstance(other, Quad) and self.op == other.op and self.result == other.result
+                and self.arg1 == other.arg1 and self.arg2 == other.arg2 and self.type == other.type)
+
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return f"Quad({self.op.name}, {self.result!r}, {self.arg1!r}, {self.arg2!r}, {self.type!r})"
+
+    def __str__(self):
+        return format_quad(self)
+
+
+def is_constant(operand):
+    return isinstance(operand, (int, float))
+
+
+def operands(quad):
+    # Scalar values read by quad: variable names, temps and constants
+    values = [getattr(quad, field) for field in OPERAND_FIELDS.get(quad.op, ())]
+    if quad.op == Op.CALL:
+        values.extend(quad.arg2)
+    return values
+
+
+class BasicBlock:
+    # A maximal run of quads entered only at the top and left only at the bottom.
+    # preds/succs are filled in by cfg.ControlFlowGraph.
+    __slots__ = ('index', 'label', 'quads', 'preds', 'succs')
+
+    def __init__(self, index, label, quads):
+        self.index = index
+        self.label = label
+        self.quads = quads
+        self.preds = []
+        self.succs = []
+
+    def __repr__(self):
+        return f"BasicBlock({self.index}, {self.label!r}, {len(self.quads)} quads)"
+
+
+def split_blocks(quads):
+    # A new block starts at every FUNC or LABEL and after every jump
+    blocks = []
+    current = []
+    for quad in quads:
+        if quad.op in (Op.FUNC, Op.LABEL) and current:
+            blocks.append(current)
+            current = []
+        current.append(quad)
+        if quad.op in JUMP_OPS:
+            blocks.append(current)
+            current = []
+    if current:
+        blocks.append(current)
+    return [BasicBlock(index, block[0].arg1 if block[0].op in (Op.FUNC, Op.LABEL) else None, block)
+            for index, block in enumerate(blocks)]
+
+
+def format_operand(operand):
+    return repr(operand) if isinstance(operand, float) else str(operand)
+
+
+def format_quad(quad):
+    op = quad.op
+    if op in OP_SYMBOLS:
+        return f"{quad.result} = {format_operand(quad.arg1)} {OP_SYMBOLS[op]} {format_operand(quad.arg2)}"
+    if op == Op.COPY:
+        return f"{quad.result} = {format_operand(quad.arg1)}"
+    if op == Op.LOAD:
+        return f"{quad.result} = {quad.arg1}[{format_operand(quad.arg2)}]"
+    if op == Op.STORE:
+        return f"{quad.result}[{format_operand(quad.arg1)}] = {format_operand(quad.arg2)}"
+    if op == Op.NOT:
+        return f"{quad.result} = not {format_operand(quad.arg1)}"
+    if op == Op.CALL:
+        return f"{quad.result} = call {quad.arg1}({', '.join(format_operand(arg) for arg in quad.arg2)})"
+    if op == Op.LABEL:
+        return f"{quad.arg1}:"
+    if op == Op.FUNC:
+        return f"func {quad.arg1}"
+    if op == Op.PARAM:
+        return f"param {quad.type} {quad.result}"
+    if op == Op.ALLOC:
+        size = f"[{quad.arg1}]" if quad.arg1 is not None else ""
+        return f"alloc {quad.type} {quad.result}{size}"
+    if op == Op.GOTO:
+        return f"goto {quad.arg1}"
+    if op == Op.IF_FALSE:
+        return f"if_false {format_operand(quad.arg1)} goto {quad.arg2}"
+    if op == Op.RETURN:
+        return f"return {format_operand(quad.arg1)}"
+    if op == Op.PRINT:
+        return f"print {format_operand(quad.arg1)}"
+    return repr(quad)
+
+
+def format_ir(quads, file=None):
+    # Labels and function headers at the left margin, instructions indented
+    for quad in quads:
+        text = format_quad(quad)
+        print(text if quad.op in (Op.FUNC, Op.LABEL) else f"    {text}", file=file)
@@ -102,15 +102,18 @@ TOKEN_TYPES = {
     PATTERN_ID: 'ID',
 }
 
+# Keywords are lexed as IDs and then reclassified by a dictionary lookup
+KEYWORD_TYPES = {keyword: TOKEN_TYPES[pattern] for keyword, pattern in KEYWORDS.items()}
+
 FIRST = {
-    '<program>': {'DEF', 'INT_TYPE', 'DOUBLE_TYPE'},
+    '<program>': {'DEF', 'INT_TYPE', 'DOUBLE_TYPE', 'ID', 'IF', 'WHILE', 'PRINT', 'RETURN', 'PERIOD'},
     '<fdecls>': {'DEF', 'ε'},
     '<fdecls\'>': {'DEF', 'ε'},
     '<fdec>': {'DEF'},
     '<params>': {'INT_TYPE', 'DOUBLE_TYPE', 'ε'},
     '<params\'>': {'COMMA', 'ε'},
     '<fname>': {'ID'},
-    '<declarations>': {'INT_TYPE', 'DOUBLE_TYPE', 'ID', 'ε'},
+    '<declarations>': {'INT_TYPE', 'DOUBLE_TYPE', 'ε'},
     '<declarations\'>': {'INT_TYPE', 'DOUBLE_TYPE', 'ε'},
     '<decl>': {'INT_TYPE', 'DOUBLE_TYPE'},
     '<type>': {'INT_TYPE', 'DOUBLE_TYPE'},
@@ -143,14 +146,14 @@ FIRST = {
 
 FOLLOW = {
     '<program>': {'PERIOD'},
-    '<fdecls>': {'INT', 'DOUBLE', 'ID', "PERIOD", 'IF', 'WHILE', 'PRINT', 'RETURN', 'FED', "PERIOD"},
-    '<fdecls\'>': {'INT', 'DOUBLE', 'ID', "PERIOD", 'IF', 'WHILE', 'PRINT', 'RETURN', 'FED', "PERIOD"},
+    '<fdecls>': {'INT_TYPE', 'DOUBLE_TYPE', 'ID', 'IF', 'WHILE', 'PRINT', 'RETURN', 'FED', 'PERIOD'},
+    '<fdecls\'>': {'INT_TYPE', 'DOUBLE_TYPE', 'ID', 'IF', 'WHILE', 'PRINT', 'RETURN', 'FED', 'PERIOD'},
     '<fdec>': {'SEMICOLON', "PERIOD"},
     '<params>': {'RPAREN'},
     '<params\'>': {'RPAREN'},
     '<fname>': {'LPAREN'},
-    '<declarations>': {'IF', 'WHILE', 'PRINT', 'RETURN', 'FED', "PERIOD"},
-    '<declarations\'>': {'SEMICOLON', 'IF', 'WHILE', 'PRINT', 'RETURN', 'FED', "PERIOD"},
+    '<declarations>': {'ID', 'IF', 'WHILE', 'PRINT', 'RETURN', 'FED', 'PERIOD'},
+    '<declarations\'>': {'SEMICOLON', 'ID', 'IF', 'WHILE', 'PRINT', 'RETURN', 'FED', 'PERIOD'},
     '<decl>': {'SEMICOLON'},
     '<type>': {'ID', '<letter>'},
     '<varlist>': {'SEMICOLON'},
@@ -159,23 +162,23 @@ FOLLOW = {
     '<statement_seq\'>': {'FI', 'OD', 'FED', 'ELSE', 'PERIOD'},
     '<statement>': {'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD'},
     '<else_part>': {'FI'},
-    '<expr>': {'RPAREN', 'COMMA', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD', 'COMP'},
-    '<expr\'>': {'RPAREN', 'COMMA', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD', 'COMP'},
-    '<term>': {'ADDOP', 'RPAREN', 'COMMA', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD', 'COMP'},
-    '<term\'>': {'ADDOP', 'RPAREN', 'COMMA', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD', 'COMP'},
-    '<factor>': {'MULOP', 'ADDOP', 'RPAREN', 'COMMA', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD'},
+    '<expr>': {'RPAREN', 'RBRACKET', 'COMMA', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD', 'COMP'},
+    '<expr\'>': {'RPAREN', 'RBRACKET', 'COMMA', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD', 'COMP'},
+    '<term>': {'ADDOP', 'RPAREN', 'RBRACKET', 'COMMA', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD', 'COMP'},
+    '<term\'>': {'ADDOP', 'RPAREN', 'RBRACKET', 'COMMA', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD', 'COMP'},
+    '<factor>': {'MULOP', 'ADDOP', 'RPAREN', 'RBRACKET', 'COMMA', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD', 'COMP'},
     '<exprseq>': {'RPAREN'},
     '<exprseq\'>': {'RPAREN'},
-    '<bexpr>': {'THEN'},
-    '<bexpr\'>': {'THEN'},
-    '<bterm>': {'OR', 'THEN'},
-    '<bterm\'>': {'OR', 'THEN'},
-    '<bfactor>': {'AND', 'OR', 'THEN', 'FI', 'OD', 'RPAREN', 'COMMA', 'SEMICOLON'},
+    '<bexpr>': {'THEN', 'DO', 'RPAREN'},
+    '<bexpr\'>': {'THEN', 'DO', 'RPAREN'},
+    '<bterm>': {'OR', 'THEN', 'DO', 'RPAREN'},
+    '<bterm\'>': {'OR', 'THEN', 'DO', 'RPAREN'},
+    '<bfactor>': {'AND', 'OR', 'THEN', 'DO', 'FI', 'OD', 'RPAREN', 'COMMA', 'SEMICOLON'},
     '<comp>': {'ID', '<number>', 'LPAREN', '<fname>'},
-    '<var>': {'MULOP', 'ADDOP', 'COMP', 'RPAREN', 'ASSIGN', 'LBRACKET', 'COMMA', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD'},
-    """ '<letter>': {'<letter>', '<digit>'},
-    '<digit>': {'<digit>'}, """
-    '<id>': {'LPAREN', 'COMMA', 'MULOP', 'ADDOP', 'COMP', 'RPAREN', 'ASSIGN', 'LBRACKET', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD'},
+    '<var>': {'MULOP', 'ADDOP', 'COMP', 'RPAREN', 'RBRACKET', 'ASSIGN', 'LBRACKET', 'COMMA', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD'},
+    # '<letter>': {'<letter>', '<digit>'},
+    # '<digit>': {'<digit>'},
+    '<id>': {'LPAREN', 'COMMA', 'MULOP', 'ADDOP', 'COMP', 'RPAREN', 'RBRACKET', 'ASSIGN', 'LBRACKET', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD'},
     '<id_chars>': {'LPAREN', 'COMMA', 'MULOP', 'ADDOP', 'COMP', 'RPAREN', 'ASSIGN', 'LBRACKET', 'SEMICOLON', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD'},
     '<number>': {'MULOP', 'ADDOP', 'RPAREN', 'COMMA', 'SEMICOLON', 'COMP', 'RBRACKET', 'FI', 'OD', 'FED', 'ELSE', 'PERIOD'},
 }
@@ -1,66 +1,145 @@
+import codecs
+import io
+import re
+import sys
+from array import array
+from bisect import bisect_right
+
+from keywords import TOKEN_TYPES, KEYWORDS, KEYWORD_TYPES, PATTERN_DOUBLE
+
+
+def build_master_regex():
+    # One alternation of named groups, compiled once.  Keyword patterns are left out
+    # because keywords are matched as IDs and reclassified through KEYWORD_TYPES.
+    # DOUBLE goes first so '3.14' is not split into INT '3' and DOUBLE '.14'.
+    keyword_patterns = set(KEYWORDS.values())
+    patterns = [PATTERN_DOUBLE] + [pattern for pattern in TOKEN_TYPES if pattern != PATTERN_DOUBLE and pattern not in keyword_patterns]
+    groups = [r'(?P<NEWLINE>\n)', r'(?P<SKIP>[^\S\n]+)']
+    groups += [f"(?P<{TOKEN_TYPES[pattern]}>{pattern})" for pattern in patterns]
+    groups.append(r'(?P<MISMATCH>.)')
+    return re.compile('|'.join(groups))
+
+MASTER_REGEX = build_master_regex()
+
 class Lexer:
-    def __init__(self, input_text):
-        self.input_text = input_text
-        self.buffer_size = 2048
-        self.buffer1 = input_text[:self.buffer_size]
-        self.buffer2 = input_text[self.buffer_size:self.buffer_size * 2]
-        self.current_buffer = 1
-        self.position = 0
-        self.current_char = self.buffer1[self.position]
+    # Tokens are only emitted once at least this many characters follow them in the
+    # buffer, so a match can never be cut short by a chunk boundary ('1.' | '5').
+    LOOKAHEAD = 2
+
+    def __init__(self, source, buffer_size=4096):
+        # source is a str, a text or binary file object, or an mmap
+        self.source = io.StringIO(source) if isinstance(source, str) else source
+        self.buffer_size = buffer_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
         self.errors = []
         self.line = 1
+        self.line_start = 0
         self.column = 1
+        self.offset = 0
 
-    def advance(self):
-        self.position += 1
-
-        if self.current_buffer == 1:
-            if self.position < len(self.buffer1):
-                self.current_char = self.buffer1[self.position]
-            else:
-                self.current_buffer = 2
-                self.position = 0
-                self.buffer2 = self.input_text[self.buffer_size * (self.current_buffer - 1):self.buffer_size * self.current_buffer]
-                self.current_char = self.buffer2[self.position] if self.position < len(self.buffer2) else None
-        elif self.current_buffer == 2:
-            if self.position < len(self.buffer2):
-                self.current_char = self.buffer2[self.position]
-            else:
-                self.current_char = None
+    def read_chunk(self):
+        while True:
+            chunk = self.source.read(self.buffer_size)
+            if not isinstance(chunk, (bytes, bytearray)):
+                return chunk
+            text = self.decoder.decode(chunk, final=not chunk)
+            if text or not chunk:
+                return text
 
-    def getNextToken(self):
-        tokens = []
-        while self.current_char is not None:
-            if self.current_char.isspace():
-                if self.current_char == '\n':
+    def scan(self):
+        # Yields (token_type, lexeme, offset) and keeps self.line/self.line_start current
+        buffer = ''
+        offset = 0
+        at_eof = False
+        while not at_eof:
+            chunk = self.read_chunk()
+            at_eof = not chunk
+            buffer += chunk
+            limit = len(buffer) if at_eof else len(buffer) - self.LOOKAHEAD
+            position = 0
+            while position < len(buffer):
+                match = MASTER_REGEX.match(buffer, position)
+                if match.end() > limit:
+                    break
+                position = match.end()
+                token_type = match.lastgroup
+                if token_type == 'NEWLINE':
                     self.line += 1
-                    self.column = 1
-                else:
-                    self.column += 1
-                self.advance()
-            else:
-                token = self._match_token()
-                if token:
-                    token_with_position = (token[0], token[1], self.line, self.column)
-                    tokens.append(token_with_position)
-                    self.column += len(token[1])
-                else:
-                    self.errors.append(f"Unexpected character '{self.current_char}' at line {self.line}, column {self.column}")
-                    self.column += 1
-                    self.advance()
+                    self.line_start = offset + position
+                    continue
+                if token_type == 'SKIP':
+                    continue
+
+                lexeme = match.group()
+                if token_type == 'MISMATCH':
+                    self.column = offset + match.start() - self.line_start + 1
+                    self.errors.append(f"Unexpected character '{lexeme}' at line {self.line}, column {self.column}")
+                    continue
+                if token_type == 'ID':
+                    token_type = KEYWORD_TYPES.get(lexeme, 'ID')
+                    if token_type == 'ID':
+                        lexeme = sys.intern(lexeme)
+                yield token_type, lexeme, offset + match.start()
+            buffer = buffer[position:]
+            offset += position
+        self.offset = offset
+        self.column = offset - self.line_start + 1
+
+    def tokenize(self):
+        for token_type, lexeme, start in self.scan():
+            self.column = start - self.line_start + 1
+            yield (token_type, lexeme, self.line, self.column)
+
+    def compact_tokens(self):
+        # Token offsets index into the source text, so it is read in full here
+        text = self.source.read()
+        if isinstance(text, (bytes, bytearray)):
+            text = bytes(text).decode('utf-8')
+        self.source = io.StringIO(text)
+        tokens = TokenBuffer(text)
+        for token_type, lexeme, start in self.scan():
+            tokens.append(token_type, start, start + len(lexeme))
         return tokens
 
-    def _match_token(self):
-        for pattern, token_type in TOKEN_TYPES.items():
-            regex = re.compile(pattern)
-            current_buffer = self.buffer1 if self.current_buffer == 1 else self.buffer2
-            match = regex.match(current_buffer, self.position)
-            if match:
-                self.position += len(match.group())
-                if self.current_buffer == 1:
-                    self.current_char = self.buffer1[self.position] if self.position < len(self.buffer1) else None
-                else:
-                    self.current_char = self.buffer2[self.position] if self.position < len(self.buffer2) else None
-
-                return token_type, match.group()
-        return None
+    def getNextToken(self):
+        return list(self.tokenize())
+
+
+class TokenBuffer:
+    # Compact token storage: kinds as array('B') codes and source offsets as
+    # array('I'). Lexemes are sliced from the source and line/column looked up in a
+    # newline-offset index on access, so items still read as (type, lexeme, line, column).
+    KINDS = list(dict.fromkeys(TOKEN_TYPES.values()))
+    KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+
+    def __init__(self, text):
+        self.text = text
+        self.kinds = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.line_starts = array('I', [0])
+        newline = text.find('\n')
+        while newline != -1:
+            self.line_starts.append(newline + 1)
+            newline = text.find('\n', newline + 1)
+
+    def append(self, token_type, start, end):
+        self.kinds.append(self.KIND_CODES[token_type])
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def line_column(self, offset):
+        line = bisect_right(self.line_starts, offset)
+        return line, offset - self.line_starts[line - 1] + 1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        start = self.starts[index]
+        line, column = self.line_column(start)
+        return (self.KINDS[self.kinds[index]], self.text[start:self.ends[index]], line, column)
+
+    def __iter__(self):
+        for index in range(len(self.kinds)):
+            yield self[index]
@@ -1,18 +1,32 @@
-import re
+import argparse
+import io
+import os
 import sys
+import time
 import traceback
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
 
-from keywords import KEYWORDS, LITERALS, TOKEN_TYPES, FIRST, FOLLOW
+from lexer import Lexer
+from parser import Parser
+from astnodes import walk
+from cfg import build_cfgs
+from pipeline import compile_functions
+from ir import format_ir
+from cache import CompilationCache, default_cache_directory
+from profiling import NO_PROFILE, Profile, write_report
+from tracing import configure_from_environment
 
-def read_file(file_path):
-    with open(file_path, 'r') as file:
-        return file.read()
+SOURCE_SUFFIX = '.cp'
+DEFAULT_SOURCE = 'Test9.cp'
+OUTPUTS = ('tokens.txt', 'ast_output.txt', 'st_output.txt', 'icg_output.txt', 'asm_output.s', 'cfg_output.txt')
 
-def write_tokens(tokens, file_path):
-    with open(file_path, 'w') as file:
-        for token in tokens:
-            file.write(f"{token[0]}: {token[1]}\n")
+
+def write_tokens(tokens, file):
+    # Pass tokens through to the parser while echoing them to file
+    for token in tokens:
+        file.write(f"{token[0]}: {token[1]}\n")
+        yield token
 
 def write_errors(errors, file_path):
     with open(file_path, 'w') as file:
@@ -20,41 +34,288 @@ def write_errors(errors, file_path):
             file.write(f"{error}\n")
 
 
-input_text = read_file("Test9.cp")
-
-# Run the lexer and parser
-lexer = Lexer(input_text)
-tokens = lexer.getNextToken()
-errors = lexer.errors
-
-parser = Parser(tokens, lexer)
-ast = parser.parse()
-errors.extend(parser.errors)
-symbol_table = SymbolTable()
-
-write_tokens(tokens, "tokens.txt")
-if errors:
-    write_errors(errors, "errors.txt")
-    print("Errors found. Check errors.txt for details.")
-else:
-    print("Parsing successful.")
-
-with open("ast_output.txt", "w") as f:
-    sys.stdout = f
-    print("\nAbstract Syntax Tree:")
-    parser.print()
-    sys.stdout = sys.__stdout__
-
-with open("st_output.txt", "w") as f:
-    sys.stdout = f
-    print("\nSymbol table:")
-    parser.symbol_table.display()
-    sys.stdout = sys.__stdout__
-
-icg = IntermediateCodeGenerator(ast, symbol_table)
-icg.generate()  
-
-with open("icg_output.txt", "w") as f:
-    sys.stdout = f    
-    icg.display()
-    sys.stdout = sys.__stdout__
+class CompileResult:
+    __slots__ = ('source', 'output_dir', 'errors', 'failure', 'cached', 'profile')
+
+    def __init__(self, source, output_dir, errors=(), failure=None, cached=False, profile=None):
+        self.source = source
+        self.output_dir = output_dir
+        self.errors = list(errors)
+        self.failure = failure
+        self.cached = cached
+        self.profile = profile
+
+    def ok(self):
+        return not self.errors and self.failure is None
+
+
+class MemoryOutputs:
+    # Output sink that keeps every output's text in self.outputs
+    def __init__(self):
+        self.outputs = {}
+
+    @contextmanager
+    def open(self, name):
+        file = io.StringIO()
+        yield file
+        self.outputs[name] = file.getvalue()
+
+
+class DirectoryOutputs:
+    # Output sink that writes each output straight into output_dir. With keep,
+    # every output is also kept in self.outputs, e.g. to be cached; otherwise
+    # self.outputs is None and no output is held in memory.
+    def __init__(self, output_dir, keep=False):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.outputs = {} if keep else None
+        self.written = []
+
+    @contextmanager
+    def open(self, name):
+        self.written.append(name)
+        with open(os.path.join(self.output_dir, name), 'w') as file:
+            if self.outputs is None:
+                yield file
+            else:
+                buffer = io.StringIO()
+                yield buffer
+                self.outputs[name] = buffer.getvalue()
+                file.write(self.outputs[name])
+
+    def finish(self, errors):
+        # Do not leave a previous run's files next to this run's
+        for name in OUTPUTS:
+            if name not in self.written and os.path.exists(os.path.join(self.output_dir, name)):
+                os.remove(os.path.join(self.output_dir, name))
+        if errors:
+            write_errors(errors, os.path.join(self.output_dir, "errors.txt"))
+        elif os.path.exists(os.path.join(self.output_dir, "errors.txt")):
+            os.remove(os.path.join(self.output_dir, "errors.txt"))
+
+
+def compile_to(source, sink, workers=1, profile=NO_PROFILE):
+    # Runs the pipeline over one program, source being its text or a text file,
+    # and returns the errors. Each output file is written to sink as soon as it
+    # is ready; errors stop the pipeline after the phase that found them. Code
+    # generation for a large program is spread over up to workers processes.
+    lexer = Lexer(source)
+    tokens = lexer.tokenize()
+    if profile.enabled:
+        # Lex up front so lexing and parsing are measured apart
+        with profile.phase('lex'):
+            tokens = lexer.compact_tokens()
+        profile.count('lex', characters=lexer.offset, tokens=len(tokens))
+    with sink.open("tokens.txt") as token_file, profile.phase('parse'):
+        tokens = write_tokens(tokens, token_file)
+        parser = Parser(tokens, lexer)
+        ast = parser.parse()
+        for token in tokens:
+            pass
+    if profile.enabled:
+        profile.count('parse', nodes=sum(1 for node in walk(ast)) if ast is not None else 0,
+                      symbols=parser.symbol_table.entry_count())
+
+    with profile.phase('format'):
+        with sink.open("ast_output.txt") as f, redirect_stdout(f):
+            print("\nAbstract Syntax Tree:")
+            parser.print()
+
+        with sink.open("st_output.txt") as f:
+            print("\nSymbol table:", file=f)
+            parser.symbol_table.display(file=f)
+
+    errors = lexer.errors + parser.errors + parser.symbol_table.errors
+    if errors:
+        return errors
+
+    with profile.phase('codegen'):
+        quads, asm_code, errors = compile_functions(ast, workers, profile=profile)
+    if errors:
+        return errors
+
+    with profile.phase('format'):
+        with sink.open("icg_output.txt") as f:
+            print("Intermediate Code:", file=f)
+            format_ir(quads, file=f)
+            print("Assembly Code:", file=f)
+            for line in asm_code:
+                print(line, file=f)
+
+        # Assemble and link with e.g. gcc -o program asm_output.s
+        with sink.open("asm_output.s") as f:
+            for line in asm_code:
+                print(line, file=f)
+
+        with sink.open("cfg_output.txt") as f:
+            global_quads, cfgs = build_cfgs(quads)
+            for graph in cfgs:
+                graph.display(file=f)
+    return []
+
+
+def compile_source(text, workers=1, profile=NO_PROFILE):
+    # compile_to for a program in memory, returning (outputs, errors) with
+    # outputs mapping each output file name to its text
+    sink = MemoryOutputs()
+    errors = compile_to(text, sink, workers, profile)
+    return sink.outputs, errors
+
+
+def write_outputs(output_dir, outputs, errors):
+    sink = DirectoryOutputs(output_dir)
+    for name, text in outputs.items():
+        with sink.open(name) as file:
+            file.write(text)
+    sink.finish(errors)
+
+
+def compile_file(source_path, output_dir, cache=None, workers=1, profile=NO_PROFILE):
+    # Compiles one source file into output_dir (see compile_to), reusing the
+    # outputs of an identical earlier compilation when cache has them. Returns
+    # (errors, whether the outputs came from the cache). Outputs are streamed to
+    # output_dir as they are produced and only held in memory to be cached.
+    with open(source_path, 'r') as source:
+        entry = None
+        if cache is not None:
+            with profile.phase('cache'):
+                key = cache.key(source)
+                entry = cache.get(key)
+            source.seek(0)
+        if entry is not None:
+            with profile.phase('write'):
+                write_outputs(output_dir, entry['outputs'], entry['errors'])
+            profile.count('write', files=len(entry['outputs']))
+            return entry['errors'], True
+
+        sink = DirectoryOutputs(output_dir, keep=cache is not None)
+        errors = compile_to(source, sink, workers, profile)
+    with profile.phase('write'):
+        sink.finish(errors)
+    profile.count('write', files=len(sink.written))
+    if cache is not None:
+        with profile.phase('cache'):
+            cache.put(key, {'outputs': sink.outputs, 'errors': errors})
+    return errors, False
+
+
+def compile_job(job):
+    # Worker entry point: never raises, so one bad input cannot stop the batch.
+    # profile is None, or an empty Profile that comes back filled in.
+    source_path, output_dir, cache, workers, profile = job
+    try:
+        with (profile or NO_PROFILE).phase('compile'):
+            errors, cached = compile_file(source_path, output_dir, cache, workers, profile or NO_PROFILE)
+        return CompileResult(source_path, output_dir, errors, cached=cached, profile=profile)
+    except Exception:
+        return CompileResult(source_path, output_dir, failure=traceback.format_exc())
+
+
+def collect_jobs(inputs, output_root):
+    # One (source, output directory) pair per source file. Files found under a
+    # directory input keep their path relative to it; names that would collide
+    # get a numeric suffix.
+    jobs = []
+    taken = set()
+    for path in inputs:
+        if os.path.isdir(path):
+            sources = []
+            for directory, subdirectories, files in os.walk(path):
+                subdirectories.sort()
+                sources.extend(os.path.join(directory, name) for name in sorted(files) if name.endswith(SOURCE_SUFFIX))
+            names = [os.path.splitext(os.path.relpath(source, path))[0] for source in sources]
+        else:
+            sources = [path]
+            names = [os.path.splitext(os.path.basename(path))[0]]
+        for source, name in zip(sources, names):
+            unique = name
+            counter = 2
+            while unique in taken:
+                unique = f"{name}-{counter}"
+                counter += 1
+            taken.add(unique)
+            jobs.append((source, os.path.join(output_root, unique)))
+    return jobs
+
+
+def run_jobs(jobs, workers, cache=None, profile_memory=None):
+    # profile_memory is None to not profile, else whether to track memory too
+    def profile():
+        return Profile(profile_memory) if profile_memory is not None else None
+
+    if workers <= 1 or len(jobs) <= 1:
+        # A single file can still spread its functions over the workers
+        return [compile_job((source, output_dir, cache, workers, profile())) for source, output_dir in jobs]
+    jobs = [(source, output_dir, cache, 1, profile()) for source, output_dir in jobs]
+    # Large batches go out in chunks so per-task IPC does not dominate small files
+    chunksize = max(1, len(jobs) // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure_from_environment) as executor:
+        return list(executor.map(compile_job, jobs, chunksize=chunksize))
+
+
+def print_summary(results, file=None):
+    failed = [result for result in results if result.failure is not None]
+    with_errors = [result for result in results if result.errors]
+    for result in with_errors:
+        print(f"{result.source}: {len(result.errors)} error(s), see {os.path.join(result.output_dir, 'errors.txt')}", file=file)
+    for result in failed:
+        print(f"{result.source}: compiler crashed\n{result.failure}", file=file)
+    cached = sum(result.cached for result in results)
+    print(f"Compiled {len(results)} file(s): {len(results) - len(with_errors) - len(failed)} ok, "
+          f"{len(with_errors)} with errors, {len(failed)} failed, {cached} from cache", file=file)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Compile .cp programs to x86-64 assembly.")
+    parser.add_argument('inputs', nargs='*',
+                        help=f"source files or directories searched for *{SOURCE_SUFFIX} files "
+                             f"(default: {DEFAULT_SOURCE}, compiled into the current directory)")
+    parser.add_argument('-o', '--output-dir', default='build',
+                        help="directory that gets one output directory per input (default: build)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument('--cache-dir', default=default_cache_directory(),
+                        help="where compiled outputs are cached between runs (default: %(default)s)")
+    parser.add_argument('--cache-size', type=int, default=1024, metavar='MB',
+                        help="size the cache is trimmed to after each run (default: %(default)s MB)")
+    parser.add_argument('--no-cache', action='store_true', help="always compile from scratch")
+    parser.add_argument('--profile', metavar='REPORT',
+                        help="write per-phase times and counts for every input and in total to REPORT as JSON")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="with --profile, also record each phase's peak memory (slows compilation down)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # Tracing is silent unless enabled, e.g. COMPILER_TRACE=parser=debug,codegen=trace
+    configure_from_environment()
+    arguments = parse_arguments(argv)
+    inputs = arguments.inputs or [DEFAULT_SOURCE]
+    missing = [path for path in inputs if not os.path.exists(path)]
+    if missing:
+        print(f"No such file or directory: {', '.join(missing)}", file=sys.stderr)
+        return 2
+    if arguments.inputs:
+        jobs = collect_jobs(arguments.inputs, arguments.output_dir)
+    else:
+        jobs = [(DEFAULT_SOURCE, os.curdir)]
+    if not jobs:
+        print("No source files found.", file=sys.stderr)
+        return 1
+
+    cache = None
+    if not arguments.no_cache:
+        cache = CompilationCache(arguments.cache_dir, arguments.cache_size * 1024 * 1024)
+    profile_memory = arguments.profile_memory if arguments.profile else None
+    started = time.perf_counter()
+    results = run_jobs(jobs, arguments.jobs, cache, profile_memory)
+    if arguments.profile:
+        write_report(arguments.profile, results, time.perf_counter() - started, arguments.profile_memory)
+    if cache is not None:
+        cache.evict()
+    print_summary(results)
+    return 0 if all(result.ok() for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,476 @@
+from collections import Counter
+
+from cfg import ControlFlowGraph, build_cfgs, join_cfgs, transfer_liveness
+from ir import Op, Quad, Temp, OP_SYMBOLS, OPERAND_FIELDS, DEFINING_OPS, COMPARISON_OPS, is_constant, operands
+from tracing import get_tracer
+
+tracer = get_tracer('optimizer')
+
+INT_BITS = 64
+
+
+def wrap_int(value):
+    # ints are 64-bit two's complement at run time
+    return (value + (1 << (INT_BITS - 1))) % (1 << INT_BITS) - (1 << (INT_BITS - 1))
+
+
+def fold_binary(op, left, right):
+    # Returns the folded value, or None when the operation must be left to run
+    # time (division by zero). Either operand being a float makes it a double
+    # operation; int division truncates toward zero like idivq.
+    if op in COMPARISON_OPS:
+        return int(COMPARE[op](left, right))
+    if op in (Op.DIV, Op.MOD) and right == 0:
+        return None
+    if isinstance(left, float) or isinstance(right, float):
+        if op == Op.MOD:
+            return None
+        return float(DOUBLE_ARITHMETIC[op](float(left), float(right)))
+    if op == Op.DIV:
+        quotient = abs(left) // abs(right)
+        return wrap_int(-quotient if (left < 0) != (right < 0) else quotient)
+    if op == Op.MOD:
+        quotient = abs(left) // abs(right)
+        quotient = -quotient if (left < 0) != (right < 0) else quotient
+        return wrap_int(left - right * quotient)
+    return wrap_int(INT_ARITHMETIC[op](left, right))
+
+
+INT_ARITHMETIC = {Op.ADD: lambda a, b: a + b, Op.SUB: lambda a, b: a - b, Op.MUL: lambda a, b: a * b}
+DOUBLE_ARITHMETIC = {**INT_ARITHMETIC, Op.DIV: lambda a, b: a / b}
+COMPARE = {Op.LT: lambda a, b: a < b, Op.LE: lambda a, b: a <= b, Op.GT: lambda a, b: a > b,
+           Op.GE: lambda a, b: a >= b, Op.EQ: lambda a, b: a == b, Op.NE: lambda a, b: a != b}
+
+
+COMMUTATIVE_OPS = frozenset((Op.ADD, Op.MUL, Op.EQ, Op.NE))
+
+
+def same_constant(first, second):
+    # 1 and 1.0 are different constants: they have different types
+    return type(first) is type(second) and first == second
+
+
+class Optimizer:
+    # Runs IR passes function by function. Each pass takes a ControlFlowGraph,
+    # rewrites its quads in place and may return a new graph when it changed the
+    # block structure. self.stats counts what each pass did.
+    PASSES = ('constant_propagation', 'value_numbering', 'loop_invariant_code_motion', 'dead_code_elimination')
+
+    def __init__(self, quads, passes=None):
+        self.quads = quads
+        self.passes = self.PASSES if passes is None else passes
+        self.stats = Counter()
+        self.global_names = set()
+
+    def optimize(self):
+        global_quads, graphs = build_cfgs(self.quads)
+        self.global_names = {quad.result for quad in global_quads}
+        optimized = []
+        for graph in graphs:
+            for name in self.passes:
+                tracer.debug("Running %s on %s", name, graph.name)
+                graph = getattr(self, name)(graph) or graph
+            optimized.append(graph)
+        self.quads = join_cfgs(global_quads, optimized)
+        return self.quads
+
+    def call_clobbered(self, graph):
+        # Globals not shadowed by a parameter or local can be changed by any call
+        local_names = {quad.result for quad in graph.entry.quads if quad.op in (Op.PARAM, Op.ALLOC)}
+        return self.global_names - local_names
+
+    def constant_propagation(self, graph):
+        # Forward data flow over the CFG. A block's state maps the variables known
+        # to hold a constant on entry; a predecessor not yet visited is skipped,
+        # so values flowing around a loop stay constant unless the loop changes
+        # them. Once the states settle, every quad is rewritten with the
+        # constants substituted and constant operations folded.
+        clobbered = self.call_clobbered(graph)
+        states_out = {}
+        changed = True
+        while changed:
+            changed = False
+            for block in graph.rpo:
+                state = self.meet([states_out[pred] for pred in block.preds if pred in states_out])
+                for quad in block.quads:
+                    self.propagate(quad, state, clobbered, rewrite=False)
+                if states_out.get(block) != state:
+                    states_out[block] = state
+                    changed = True
+
+        for block in graph.rpo:
+            state = self.meet([states_out[pred] for pred in block.preds if pred in states_out])
+            for quad in block.quads:
+                self.propagate(quad, state, clobbered, rewrite=True)
+
+    def meet(self, states):
+        if not states:
+            return {}
+        merged = dict(states[0])
+        for state in states[1:]:
+            for name, value in list(merged.items()):
+                if name not in state or not same_constant(state[name], value):
+                    del merged[name]
+        return merged
+
+    def propagate(self, quad, state, clobbered, rewrite):
+        op = quad.op
+        values = {}
+        for field in OPERAND_FIELDS.get(op, ()):
+            operand = getattr(quad, field)
+            values[field] = state.get(operand, operand) if isinstance(operand, str) else operand
+        if op == Op.CALL:
+            args = tuple(state.get(arg, arg) if isinstance(arg, str) else arg for arg in quad.arg2)
+
+        result = None
+        if op in DEFINING_OPS:
+            left = values.get('arg1')
+            right = values.get('arg2')
+            if op == Op.COPY:
+                result = left
+                if quad.type == 'double' and isinstance(result, int):
+                    result = float(result)
+            elif op == Op.NOT and is_constant(left):
+                result = left ^ 1
+            elif op in OP_SYMBOLS and is_constant(left) and is_constant(right):
+                result = fold_binary(op, left, right)
+
+            if is_constant(result):
+                state[quad.result] = result
+            else:
+                state.pop(quad.result, None)
+        if op == Op.CALL:
+            for name in clobbered:
+                state.pop(name, None)
+
+        if not rewrite:
+            return
+        for field, value in values.items():
+            if value is not getattr(quad, field) and is_constant(value):
+                setattr(quad, field, value)
+                self.stats['constants propagated'] += 1
+        if op == Op.CALL and args != quad.arg2:
+            self.stats['constants propagated'] += sum(1 for old, new in zip(quad.arg2, args) if old is not new)
+            quad.arg2 = args
+        if is_constant(result) and (op != Op.COPY or quad.arg1 is not result):
+            if op != Op.COPY:
+                self.stats['operations folded'] += 1
+            quad.op = Op.COPY
+            quad.arg1 = result
+            quad.arg2 = None
+
+    def dead_code_elimination(self, graph):
+        # Repeat until nothing changes: fold constant branches, drop blocks the
+        # entry can no longer reach, then delete assignments whose value is never
+        # read. Each step can expose more work for the others.
+        while True:
+            changed = self.simplify_branches(graph)
+            reachable = [block for block in graph.blocks if graph.reachable(block)]
+            if len(reachable) != len(graph.blocks):
+                self.stats['unreachable blocks removed'] += len(graph.blocks) - len(reachable)
+                changed = True
+            quads = [quad for block in reachable for quad in block.quads]
+            targets = {quad.arg1 if quad.op == Op.GOTO else quad.arg2 for quad in quads if quad.op in (Op.GOTO, Op.IF_FALSE)}
+            labelled = [quad for quad in quads if quad.op != Op.LABEL or quad.arg1 in targets]
+            if changed or len(labelled) != len(quads):
+                graph = ControlFlowGraph(labelled)
+            if not self.remove_dead_assignments(graph) and not changed:
+                return graph
+            graph = ControlFlowGraph(graph.quads())
+
+    def simplify_branches(self, graph):
+        changed = False
+        blocks = graph.blocks
+        for position, block in enumerate(blocks):
+            last = block.quads[-1]
+            if last.op == Op.IF_FALSE and is_constant(last.arg1):
+                if last.arg1 == 0:
+                    last.op = Op.GOTO
+                    last.arg1 = last.arg2
+                    last.arg2 = None
+                else:
+                    block.quads.pop()
+                self.stats['constant branches folded'] += 1
+                changed = True
+            # A jump to the label that follows it anyway
+            last = block.quads[-1] if block.quads else None
+            following = blocks[position + 1] if position + 1 < len(blocks) else None
+            if last is not None and last.op == Op.GOTO and following is not None and following.label == last.arg1:
+                block.quads.pop()
+                self.stats['redundant jumps removed'] += 1
+                changed = True
+        return changed
+
+    def remove_dead_assignments(self, graph):
+        # Globals are live wherever control leaves the function and at every
+        # call, since the callee may read them.
+        clobbered = self.call_clobbered(graph)
+        live_in, live_out = graph.liveness(exit_live=clobbered, call_live=clobbered)
+
+        removed = 0
+        for block in graph.rpo:
+            live = set(live_out[block])
+            kept = []
+            for quad in reversed(block.quads):
+                if quad.op in DEFINING_OPS and quad.result not in live and not self.has_side_effects(quad):
+                    removed += 1
+                    continue
+                transfer_liveness(quad, live, clobbered)
+                kept.append(quad)
+            kept.reverse()
+            block.quads[:] = kept
+        self.stats['dead assignments removed'] += removed
+        return removed > 0
+
+    def has_side_effects(self, quad):
+        # Calls may print or write globals; division can trap unless the divisor
+        # is a known non-zero constant
+        if quad.op == Op.CALL:
+            return True
+        if quad.op in (Op.DIV, Op.MOD):
+            return not (is_constant(quad.arg2) and quad.arg2 != 0)
+        return False
+
+    def local_value_numbering(self, graph):
+        self.number_values(graph, extended=False)
+
+    def value_numbering(self, graph):
+        self.number_values(graph, extended=True)
+
+    def number_values(self, graph, extended):
+        # Value numbering: operands get a number per distinct value and each pure
+        # operation is keyed by its opcode and operand numbers. A repeated key
+        # becomes a COPY from the name that already holds the value, and operands
+        # are rewritten to that name so the copies die in dead_code_elimination.
+        #
+        # The extended form walks the dominator tree and lets a block reuse
+        # values computed in the blocks that dominate it. Only temps carry over:
+        # they are assigned once, so their values still hold, while a variable
+        # may have been reassigned on the way and is renumbered in every block
+        # (its entry in value_of is stamped with the block) unless it is stable:
+        # never assigned in the function and not changeable by a call, or
+        # assigned once, in the entry block, before any use. Array loads never
+        # carry over and are invalidated by stores to that array and by calls.
+        clobbered = self.call_clobbered(graph)
+        definitions = Counter(quad.result for block in graph.blocks for quad in block.quads if quad.op in DEFINING_OPS)
+        has_calls = any(quad.op == Op.CALL for block in graph.blocks for quad in block.quads)
+        stable = set()
+        used = set()
+        for quad in graph.entry.quads:
+            used.update(operand for operand in operands(quad) if isinstance(operand, str))
+            if quad.op in DEFINING_OPS and definitions[quad.result] == 1 and quad.result not in used:
+                stable.add(quad.result)
+        if has_calls:
+            stable -= clobbered
+        value_of = {}
+        expressions = {}
+        holder = {}
+        undo = []
+        counter = [0, 0]  # next value number, calls seen
+
+        def assign(table, key, value):
+            undo.append((table, key, table.get(key, undo)))
+            table[key] = value
+
+        def scope(name, stamp):
+            if isinstance(name, Temp) or name in stable:
+                return None
+            if name not in definitions and not (has_calls and name in clobbered):
+                return None
+            return stamp
+
+        def new_value(name):
+            counter[0] += 1
+            holder.setdefault(counter[0], name)
+            return counter[0]
+
+        def number(operand, stamp):
+            if is_constant(operand):
+                key = (type(operand), operand)
+                if key not in expressions:
+                    assign(expressions, key, new_value(operand))
+                return expressions[key]
+            entry = value_of.get(operand)
+            if entry is not None and (entry[1] is None or entry[1] == stamp):
+                return entry[0]
+            value = new_value(operand)
+            assign(value_of, operand, (value, scope(operand, stamp)))
+            return value
+
+        def current_holder(value, stamp):
+            name = holder.get(value)
+            if name is None or is_constant(name):
+                return name
+            entry = value_of.get(name)
+            if entry is not None and entry[0] == value and (entry[1] is None or entry[1] == stamp):
+                return name
+            return None
+
+        def canonical(operand, value, stamp):
+            # Prefer a temp or constant already holding the value; temps stay valid
+            name = current_holder(value, stamp)
+            if name is not None and (is_constant(name) or isinstance(name, Temp)):
+                return name
+            return operand
+
+        def visit(block):
+            stamp = block.index
+            array_versions = {}
+            for quad in block.quads:
+                op = quad.op
+                numbers = {}
+                for field in OPERAND_FIELDS.get(op, ()):
+                    operand = getattr(quad, field)
+                    numbers[field] = number(operand, stamp)
+                    setattr(quad, field, canonical(operand, numbers[field], stamp))
+                if op == Op.CALL:
+                    quad.arg2 = tuple(canonical(arg, number(arg, stamp), stamp) for arg in quad.arg2)
+
+                if op == Op.STORE:
+                    array_versions[quad.result] = array_versions.get(quad.result, 0) + 1
+                if op == Op.CALL:
+                    counter[1] += 1
+                    for name in clobbered:
+                        if name in value_of:
+                            assign(value_of, name, (new_value(name), stamp))
+                if op not in DEFINING_OPS:
+                    continue
+
+                if op == Op.COPY:
+                    value = numbers['arg1']
+                elif op == Op.CALL:
+                    value = new_value(quad.result)
+                else:
+                    if op == Op.LOAD:
+                        key = (op, quad.arg1, numbers['arg2'], stamp, counter[1], array_versions.get(quad.arg1, 0))
+                    elif op == Op.NOT:
+                        key = (op, numbers['arg1'])
+                    elif op in COMMUTATIVE_OPS:
+                        key = (op,) + tuple(sorted((numbers['arg1'], numbers['arg2'])))
+                    else:
+                        key = (op, numbers['arg1'], numbers['arg2'])
+                    value = expressions.get(key)
+                    existing = current_holder(value, stamp) if value is not None else None
+                    if existing is not None:
+                        quad.op = Op.COPY
+                        quad.arg1 = existing
+                        quad.arg2 = None
+                        self.stats['redundant expressions removed'] += 1
+                    else:
+                        value = new_value(quad.result)
+                        assign(expressions, key, value)
+                assign(value_of, quad.result, (value, scope(quad.result, stamp)))
+                if current_holder(value, stamp) is None:
+                    assign(holder, value, quad.result)
+
+        def rollback(mark):
+            while len(undo) > mark:
+                table, key, previous = undo.pop()
+                if previous is undo:
+                    del table[key]
+                else:
+                    table[key] = previous
+
+        if not extended:
+            for block in graph.rpo:
+                visit(block)
+                rollback(0)
+            return
+
+        # Preorder walk of the dominator tree; leaving a block rolls its entries back
+        stack = [(graph.entry, None)]
+        while stack:
+            block, mark = stack.pop()
+            if mark is not None:
+                rollback(mark)
+                continue
+            stack.append((block, len(undo)))
+            visit(block)
+            stack.extend((child, None) for child in reversed(graph.dom_children[block]))
+
+    def loop_invariant_code_motion(self, graph):
+        # Inner loops first, so code hoisted into an inner preheader can move on
+        # out of the enclosing loop. Each loop sees the code of its nested loops
+        # as it will be laid out, with their preheaders in place; the quads are
+        # only moved, and the graph rebuilt, once every loop has been handled.
+        hoisted = {}
+        moved = set()
+        for loop in sorted(graph.loops, key=lambda loop: -loop.depth):
+            if self.falls_into_header(graph, loop):
+                continue
+            invariants = self.find_invariants(graph, self.loop_layout(graph, loop, hoisted, moved))
+            if invariants:
+                lifted = set(map(id, invariants))
+                for header, quads in hoisted.items():
+                    if header in loop.blocks:
+                        quads[:] = [quad for quad in quads if id(quad) not in lifted]
+                hoisted[loop.header] = invariants
+                moved |= lifted
+        if hoisted:
+            return self.insert_preheaders(graph, hoisted, moved)
+
+    def falls_into_header(self, graph, loop):
+        # The preheader goes right before the header in the layout, so code that
+        # fell through into the header falls through the preheader instead; that
+        # must not include the loop's own back edge.
+        position = graph.blocks.index(loop.header)
+        if position == 0:
+            return False
+        previous = graph.blocks[position - 1]
+        return previous in loop.blocks and previous.quads[-1].op not in (Op.GOTO, Op.RETURN)
+
+    def loop_layout(self, graph, loop, hoisted, moved):
+        # The loop's quads in layout order as if the preheaders of its nested
+        # loops were already in place
+        layout = []
+        for block in graph.blocks:
+            if block in loop.blocks:
+                if block is not loop.header:
+                    layout.extend(hoisted.get(block, ()))
+                layout.extend(quad for quad in block.quads if id(quad) not in moved)
+        return layout
+
+    def find_invariants(self, graph, layout):
+        # A computation into a temp is invariant when each operand is a constant,
+        # a name the loop never assigns (nor a call in it could), or the result
+        # of another invariant. Only pure arithmetic moves: it is safe to run even
+        # when the loop body never does. Loads, calls and divisions that could
+        # trap stay put, as do prints and stores.
+        assigned = {quad.result for quad in layout if quad.op in DEFINING_OPS}
+        if any(quad.op == Op.CALL for quad in layout):
+            assigned |= self.call_clobbered(graph)
+
+        invariant = set()
+        changed = True
+        while changed:
+            changed = False
+            for quad in layout:
+                if quad.result in invariant or quad.op not in DEFINING_OPS or quad.op in (Op.CALL, Op.LOAD):
+                    continue
+                if not isinstance(quad.result, Temp) or self.has_side_effects(quad):
+                    continue
+                if all(is_constant(operand) or operand in invariant or operand not in assigned for operand in operands(quad)):
+                    invariant.add(quad.result)
+                    changed = True
+        return [quad for quad in layout if quad.op in DEFINING_OPS and quad.result in invariant]
+
+    def insert_preheaders(self, graph, hoisted, moved):
+        # hoisted maps a loop header to the quads for its preheader. Jumps to the
+        # header from outside its loop are redirected to the preheader.
+        loops = {loop.header: loop for loop in graph.loops if loop.header in hoisted}
+        labels = {header.label: loops[header] for header in hoisted}
+        quads = []
+        for block in graph.blocks:
+            if block in hoisted:
+                quads.append(Quad(Op.LABEL, arg1=f"{block.label}_pre"))
+                quads.extend(hoisted[block])
+                self.stats['loop invariants hoisted'] += len(hoisted[block])
+            for quad in block.quads:
+                if id(quad) in moved:
+                    continue
+                if quad.op == Op.GOTO and quad.arg1 in labels and block not in labels[quad.arg1].blocks:
+                    quad.arg1 = f"{quad.arg1}_pre"
+                elif quad.op == Op.IF_FALSE and quad.arg2 in labels and block not in labels[quad.arg2].blocks:
+                    quad.arg2 = f"{quad.arg2}_pre"
+                quads.append(quad)
+        return ControlFlowGraph(quads)
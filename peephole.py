@@ -0,0 +1,153 @@
+from collections import Counter
+
+from tracing import get_tracer
+
+tracer = get_tracer('codegen')
+
+# Jump taken exactly when the condition of the set instruction is false
+INVERSE_JUMPS = {'setl': 'jge', 'setle': 'jg', 'setg': 'jle', 'setge': 'jl', 'sete': 'jne', 'setne': 'je',
+                 'setb': 'jae', 'setbe': 'ja', 'seta': 'jbe', 'setae': 'jb'}
+OPPOSITE_JUMPS = {'jl': 'jge', 'jge': 'jl', 'jle': 'jg', 'jg': 'jle', 'je': 'jne', 'jne': 'je',
+                  'jb': 'jae', 'jae': 'jb', 'jbe': 'ja', 'ja': 'jbe'}
+
+
+def parse(line):
+    # (opcode, operands) for an instruction line; None for labels and directives
+    if not line.startswith('    ') or line.lstrip().startswith('.'):
+        return None
+    opcode, _, rest = line.strip().partition(' ')
+    return opcode, rest.split(', ') if rest else []
+
+
+def label_of(line):
+    return line[:-1] if not line.startswith(' ') and line.endswith(':') else None
+
+
+def instruction(opcode, *operands):
+    return f"    {opcode} {', '.join(operands)}" if operands else f"    {opcode}"
+
+
+def is_register(operand):
+    return operand.startswith('%')
+
+
+class PeepholeOptimizer:
+    # Rewrites the assembly from AssemblyGenerator through a table of rules.
+    # Each rule looks at a window of consecutive lines and returns replacement
+    # lines or None; after a rewrite the scan backs up far enough for earlier
+    # windows to see the change, so rules compose until nothing matches.
+    # self.stats counts how often each rule fired and self.removed how many
+    # lines it saved.
+    #
+    # The rules rely on two properties of the generated code: %rax is scratch,
+    # dead between the instructions for one quad and the next except where a
+    # comparison feeds the branch right after it, and nothing reads the flags
+    # set by imulq.
+    RULES = {
+        'self_move': 1,
+        'redundant_move': 2,
+        'multiply_by_power_of_two': 1,
+        'branch_on_flags': 4,
+        'dead_condition': 3,
+        'branch_over_jump': 3,
+        'jump_to_next': 2,
+    }
+
+    def __init__(self, asm_code, rules=None):
+        self.asm_code = list(asm_code)
+        self.rules = tuple(self.RULES) if rules is None else rules
+        self.stats = Counter()
+        self.removed = Counter()
+
+    def optimize(self):
+        lines = self.asm_code
+        back_up = max((self.RULES[name] for name in self.rules), default=1) - 1
+        position = 0
+        while position < len(lines):
+            for name in self.rules:
+                size = self.RULES[name]
+                window = lines[position:position + size]
+                replacement = getattr(self, name)(window) if len(window) == size else None
+                if replacement is not None:
+                    lines[position:position + size] = replacement
+                    self.stats[name] += 1
+                    self.removed[name] += size - len(replacement)
+                    position = max(position - back_up, 0)
+                    break
+            else:
+                position += 1
+        for name in self.rules:
+            tracer.debug("Peephole rule %s: %d applied, %d lines removed", name, self.stats[name], self.removed[name])
+        return lines
+
+    def self_move(self, window):
+        # movq X, X
+        parsed = parse(window[0])
+        if parsed and parsed[0] == 'movq' and parsed[1][0] == parsed[1][1]:
+            return []
+        return None
+
+    def redundant_move(self, window):
+        # movq A, B; movq B, A -> the second move changes nothing, unless the
+        # first one changed a register A's address is computed from
+        first, second = parse(window[0]), parse(window[1])
+        if not (first and second and first[0] == 'movq' and second[0] == 'movq'):
+            return None
+        source, destination = first[1]
+        if second[1] == [destination, source] and not (is_register(destination) and destination in source):
+            return window[:1]
+        return None
+
+    def multiply_by_power_of_two(self, window):
+        # imulq $2^k, R -> salq $k, R
+        parsed = parse(window[0])
+        if not (parsed and parsed[0] == 'imulq' and len(parsed[1]) == 2 and parsed[1][0].startswith('$')):
+            return None
+        try:
+            factor = int(parsed[1][0][1:])
+        except ValueError:
+            return None
+        if factor <= 0 or factor & (factor - 1):
+            return None
+        if factor == 1:
+            return []
+        return [instruction('salq', f"${factor.bit_length() - 1}", parsed[1][1])]
+
+    def branch_on_flags(self, window):
+        # setCC %al; movzbq %al, R; cmpq $0, R; je L -> branch on the flags the
+        # set instruction read, which movzbq leaves alone
+        parsed = [parse(line) for line in window]
+        if not all(parsed):
+            return None
+        (set_op, set_args), (extend, extend_args), (compare, compare_args), (jump, jump_args) = parsed
+        if (set_op in INVERSE_JUMPS and set_args == ['%al'] and extend == 'movzbq' and extend_args[0] == '%al'
+                and compare == 'cmpq' and compare_args == ['$0', extend_args[1]] and jump == 'je'):
+            return window[:2] + [instruction(INVERSE_JUMPS[set_op], jump_args[0])]
+        return None
+
+    def dead_condition(self, window):
+        # setCC %al; movzbq %al, %rax; jCC L -> only the branch needs the result
+        parsed = [parse(line) for line in window]
+        if not all(parsed):
+            return None
+        (set_op, set_args), (extend, extend_args), (jump, _) = parsed
+        if (set_op in INVERSE_JUMPS and set_args == ['%al'] and extend == 'movzbq'
+                and extend_args == ['%al', '%rax'] and jump in OPPOSITE_JUMPS):
+            return window[2:]
+        return None
+
+    def branch_over_jump(self, window):
+        # jCC L1; jmp L2; L1: -> jNCC L2; L1:
+        first, second = parse(window[0]), parse(window[1])
+        target = label_of(window[2])
+        if (first and second and first[0] in OPPOSITE_JUMPS and second[0] == 'jmp'
+                and target is not None and first[1] == [target]):
+            return [instruction(OPPOSITE_JUMPS[first[0]], second[1][0]), window[2]]
+        return None
+
+    def jump_to_next(self, window):
+        # jmp L; L:
+        parsed = parse(window[0])
+        if parsed and parsed[0] in ('jmp',) + tuple(OPPOSITE_JUMPS) and parsed[1] == [label_of(window[1])]:
+            return window[1:]
+        return None
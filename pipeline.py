@@ -0,0 +1,129 @@
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from astnodes import Program, FuncDef
+from cfg import ControlFlowGraph
+from codegenerator import IntermediateCodeGenerator, MAIN_FUNCTION
+from optimizer import Optimizer
+from asmgenerator import AssemblyGenerator
+from peephole import PeepholeOptimizer
+from profiling import NO_PROFILE, Profile
+from symboltable import SymbolTable
+from tracing import configure_from_environment, get_tracer
+
+tracer = get_tracer('codegen')
+
+# Below this many functions starting worker processes costs more than it saves
+PARALLEL_THRESHOLD = 256
+
+
+class FunctionCode:
+    # One function's optimized quads and peephole-optimized assembly, or the
+    # code generator's errors for it. A function compiled in a worker process
+    # brings back its profile.
+    __slots__ = ('quads', 'errors', 'asm_code', 'constants', 'profile')
+
+    def __init__(self, quads, errors, asm_code=(), constants=()):
+        self.quads = quads
+        self.errors = errors
+        self.asm_code = asm_code
+        self.constants = constants
+        self.profile = None
+
+
+def outline(program):
+    # The program without its function bodies and statements: all that the
+    # code for one function needs to know about the rest
+    functions = [FuncDef(fdec.return_type, fdec.name, fdec.params, [], []) for fdec in program.functions]
+    return Program(functions, program.declarations, [])
+
+
+class FunctionCompiler:
+    # Takes one function at a time from the AST to assembly: IR, optimization,
+    # instruction selection and peephole. Temps and labels are numbered per
+    # function and every function starts from the same declarations, so the
+    # result does not depend on which functions were compiled before it.
+
+    def __init__(self, program, allocator='linear'):
+        self.generator = IntermediateCodeGenerator(program, SymbolTable())
+        self.generator.declare_program(program)
+        self.global_quads = self.generator.ic_code
+        self.errors = self.generator.errors
+        self.assembler = AssemblyGenerator(self.global_quads, allocator)
+        for quad in self.global_quads:
+            self.assembler.declare_global(quad)
+        for fdec in program.functions:
+            self.assembler.declare_function(fdec.name, fdec.return_type, [param.type for param in fdec.params])
+        self.assembler.declare_function(MAIN_FUNCTION, 'int', [])
+
+    def compile(self, function, profile=NO_PROFILE):
+        # function is a FuncDef, or the program's statement list for main
+        with profile.phase('ir'):
+            quads, errors = self.generator.generate_function(function)
+        profile.count('ir', functions=1, quads=len(quads))
+        if errors:
+            return FunctionCode(quads, errors)
+        with profile.phase('optimize'):
+            quads = Optimizer(self.global_quads + quads).optimize()[len(self.global_quads):]
+        profile.count('optimize', quads=len(quads))
+        with profile.phase('assemble'):
+            asm_code, constants = self.assembler.generate_function(ControlFlowGraph(quads))
+        profile.count('assemble', instructions=len(asm_code))
+        with profile.phase('peephole'):
+            optimized = PeepholeOptimizer(asm_code).optimize()
+        profile.count('peephole', instructions=len(optimized), removed=len(asm_code) - len(optimized))
+        return FunctionCode(quads, [], optimized, constants)
+
+
+worker_compiler = None
+worker_profile = None
+
+
+def start_worker(program, allocator, profile_memory):
+    # profile_memory is None when the parent is not profiling
+    global worker_compiler, worker_profile
+    configure_from_environment()
+    worker_compiler = FunctionCompiler(program, allocator)
+    if profile_memory is not None:
+        worker_profile = profile_memory
+        if profile_memory:
+            tracemalloc.start()
+
+
+def compile_in_worker(function):
+    if worker_profile is None:
+        return worker_compiler.compile(function)
+    profile = Profile(worker_profile)
+    code = worker_compiler.compile(function, profile)
+    code.profile = profile
+    return code
+
+
+def compile_functions(program, workers=1, allocator='linear', profile=NO_PROFILE):
+    # Code for a whole program as (quads, assembly lines, errors). Functions
+    # are compiled independently, on a process pool of the given size when
+    # there are enough of them, and linked in source order, so the output is
+    # the same whichever way they ran.
+    functions = program.functions + [program.statements]
+    compiler = FunctionCompiler(outline(program), allocator)
+    if workers > 1 and len(functions) >= PARALLEL_THRESHOLD:
+        tracer.debug("Compiling %d functions on %d processes", len(functions), workers)
+        chunksize = max(1, len(functions) // (workers * 8))
+        profile_memory = profile.memory if profile.enabled else None
+        with ProcessPoolExecutor(max_workers=workers, initializer=start_worker,
+                                 initargs=(outline(program), allocator, profile_memory)) as executor:
+            code = list(executor.map(compile_in_worker, functions, chunksize=chunksize))
+        if profile.enabled:
+            for function in code:
+                profile.merge(function.profile)
+    else:
+        code = [compiler.compile(function, profile) for function in functions]
+
+    errors = compiler.errors + [error for function in code for error in function.errors]
+    if errors:
+        return None, None, errors
+    quads = compiler.global_quads + [quad for function in code for quad in function.quads]
+    with profile.phase('link'):
+        asm_code = compiler.assembler.link([(function.asm_code, function.constants) for function in code])
+    profile.count('link', instructions=len(asm_code))
+    return quads, asm_code, []
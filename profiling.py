@@ -0,0 +1,135 @@
+import json
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+
+# Phases whose speed is reported in tokens per second
+THROUGHPUT_PHASES = ('lex', 'parse', 'compile')
+
+
+class PhaseStats:
+    __slots__ = ('calls', 'wall', 'cpu', 'peak', 'counts')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0
+        self.counts = Counter()
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.wall += other.wall
+        self.cpu += other.cpu
+        self.peak = max(self.peak, other.peak)
+        self.counts.update(other.counts)
+
+
+class Profile:
+    # Wall time, CPU time and item counts per phase of a compilation, and with
+    # memory set the peak memory each phase allocated on top of what was
+    # already in use, as tracemalloc sees it. Phases may nest: a nested phase
+    # is recorded on its own and also counts towards the one around it.
+    # Profiles from several compilations or processes add up with merge().
+    #
+    # tracemalloc is started for the outermost phase unless it is running
+    # already, and it slows everything down, so timings taken with memory set
+    # are only comparable with each other.
+    enabled = True
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.phases = {}
+        self.open = []
+
+    @contextmanager
+    def phase(self, name):
+        started_tracing = self.memory and not self.open and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            for entry in self.open:
+                entry[1] = max(entry[1], peak)
+            tracemalloc.reset_peak()
+            self.open.append([current, current])
+        else:
+            self.open.append(None)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            stats = self.stats(name)
+            stats.calls += 1
+            stats.wall += time.perf_counter() - wall
+            stats.cpu += time.process_time() - cpu
+            entry = self.open.pop()
+            if entry is not None:
+                base, peak = entry
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                stats.peak = max(stats.peak, peak - base)
+                if self.open:
+                    self.open[-1][1] = max(self.open[-1][1], peak)
+            if started_tracing:
+                tracemalloc.stop()
+
+    def stats(self, name):
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = PhaseStats()
+        return stats
+
+    def count(self, name, **counts):
+        self.stats(name).counts.update(counts)
+
+    def merge(self, other):
+        for name, stats in other.phases.items():
+            self.stats(name).merge(stats)
+        return self
+
+    def report(self):
+        # The phases as a JSON-ready dict, in the order they first ran, with
+        # the program's tokens over the time taken by the phases that read it
+        tokens = self.phases['lex'].counts['tokens'] if 'lex' in self.phases else 0
+        phases = {}
+        for name, stats in self.phases.items():
+            entry = {'calls': stats.calls, 'wall_seconds': round(stats.wall, 6), 'cpu_seconds': round(stats.cpu, 6)}
+            if self.memory:
+                entry['peak_bytes'] = stats.peak
+            entry.update(sorted(stats.counts.items()))
+            if tokens and stats.wall > 0 and name in THROUGHPUT_PHASES:
+                entry['tokens_per_second'] = round(tokens / stats.wall)
+            phases[name] = entry
+        return phases
+
+
+class NullProfile:
+    # Stands in for a Profile when nothing is being measured
+    enabled = False
+    memory = False
+
+    def phase(self, name):
+        return nullcontext()
+
+    def count(self, name, **counts):
+        pass
+
+
+NO_PROFILE = NullProfile()
+
+
+def write_report(path, results, wall, memory=False):
+    # One JSON report for a batch: every compilation's phases and their sum
+    total = Profile(memory)
+    files = []
+    for result in results:
+        if result.profile is None:
+            continue
+        total.merge(result.profile)
+        files.append({'source': result.source, 'cached': result.cached, 'phases': result.profile.report()})
+    report = {'files': files, 'total': {'files': len(files), 'wall_seconds': round(wall, 6), 'phases': total.report()}}
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+        file.write('\n')
@@ -0,0 +1,270 @@
+from bisect import bisect_right
+
+from ir import Op, Temp, DEFINING_OPS, operands
+from tracing import get_tracer
+
+tracer = get_tracer('codegen')
+
+# %rax, %rdx and %r11 are never allocated: the backend uses them as scratch, and
+# idivq needs %rax:%rdx. Caller-saved registers are only given to values that are
+# not live across a call (print included); callee-saved ones are saved in the
+# prologue of any function that uses them.
+CALLEE_SAVED = ('%rbx', '%r12', '%r13', '%r14', '%r15')
+CALLER_SAVED = ('%rcx', '%rsi', '%rdi', '%r8', '%r9', '%r10')
+ALL_REGISTERS = CALLER_SAVED + CALLEE_SAVED
+CALL_OPS = frozenset((Op.CALL, Op.PRINT))
+
+
+class Frame:
+    # 8-byte slots below %rbp, handed out downwards
+    def __init__(self):
+        self.size = 0
+
+    def allocate(self, words=1):
+        self.size += 8 * words
+        return -self.size
+
+    def aligned_size(self):
+        return (self.size + 15) // 16 * 16
+
+
+class Interval:
+    __slots__ = ('name', 'start', 'end', 'crosses_call', 'weight')
+
+    def __init__(self, name, position):
+        self.name = name
+        self.start = position
+        self.end = position
+        self.crosses_call = False
+        self.weight = 0
+
+    def extend(self, position):
+        if position < self.start:
+            self.start = position
+        if position > self.end:
+            self.end = position
+
+    def __repr__(self):
+        return f"Interval({self.name}, {self.start}, {self.end}, crosses_call={self.crosses_call})"
+
+
+class Allocation:
+    def __init__(self):
+        self.registers = {}
+        self.slots = {}
+        self.frame = Frame()
+
+    def spill(self, name):
+        self.slots[name] = self.frame.allocate()
+
+    def location(self, name):
+        if name in self.registers:
+            return self.registers[name]
+        if name in self.slots:
+            return f"{self.slots[name]}(%rbp)"
+        return None
+
+    def callee_saved_used(self):
+        used = set(self.registers.values())
+        return [register for register in CALLEE_SAVED if register in used]
+
+
+def local_types(graph):
+    # Type of each parameter, scalar local and temp of the function
+    types = {}
+    for block in graph.blocks:
+        for quad in block.quads:
+            if quad.op == Op.PARAM or (quad.op == Op.ALLOC and quad.arg1 is None):
+                types[quad.result] = quad.type
+            elif quad.op in DEFINING_OPS and isinstance(quad.result, Temp):
+                types[quad.result] = quad.type
+    return types
+
+
+class RegisterAllocator:
+    # Shared analysis: which names live in registers (the function's int temps,
+    # parameters and scalar locals; globals, arrays and doubles stay in memory),
+    # their live intervals over the block layout, whether each is live across a
+    # call, and a spill weight of 10^loop depth per use or definition.
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.allocation = Allocation()
+        self.types = local_types(graph)
+        self.names = {name for name, type in self.types.items() if type != 'double'}
+        self.live_in, self.live_out = graph.liveness()
+        self.intervals = self.build_intervals()
+
+    def build_intervals(self):
+        intervals = {}
+        call_positions = []
+        names = self.names
+
+        def touch(name, position, weight=0):
+            if name not in names:
+                return
+            interval = intervals.get(name)
+            if interval is None:
+                interval = intervals[name] = Interval(name, position)
+            else:
+                interval.extend(position)
+            interval.weight += weight
+
+        position = 0
+        for block in self.graph.blocks:
+            weight = 10 ** self.graph.loop_depth(block)
+            for name in self.live_in[block]:
+                touch(name, position)
+            for quad in block.quads:
+                position += 1
+                if quad.op == Op.PARAM:
+                    touch(quad.result, 0, weight)
+                for operand in operands(quad):
+                    if isinstance(operand, str):
+                        touch(operand, position, weight)
+                if quad.op in DEFINING_OPS:
+                    touch(quad.result, position, weight)
+                if quad.op in CALL_OPS:
+                    call_positions.append(position)
+            for name in self.live_out[block]:
+                touch(name, position + 1)
+            position += 1
+
+        for interval in intervals.values():
+            # A call at one end of the interval reads or produces the value; only
+            # a call strictly inside it needs the value preserved
+            index = bisect_right(call_positions, interval.start)
+            interval.crosses_call = index < len(call_positions) and call_positions[index] < interval.end
+        return intervals
+
+    def allowed_registers(self, interval):
+        return CALLEE_SAVED if interval.crosses_call else ALL_REGISTERS
+
+    def allocate(self):
+        self.assign_registers()
+        for name in sorted(self.types):
+            if self.types[name] == 'double':
+                self.allocation.spill(name)
+        return self.allocation
+
+    def assign_registers(self):
+        raise NotImplementedError
+
+
+class LinearScanAllocator(RegisterAllocator):
+    # Poletto & Sarkar linear scan: walk intervals by start, free registers of
+    # intervals that have ended, and when none fits spill whichever of the
+    # current interval and the active ones using a suitable register ends last.
+
+    def assign_registers(self):
+        allocation = self.allocation
+        active = []
+        free = set(ALL_REGISTERS)
+        for interval in sorted(self.intervals.values(), key=lambda interval: (interval.start, interval.end, interval.name)):
+            still_active = []
+            for other in active:
+                if other.end < interval.start:
+                    free.add(allocation.registers[other.name])
+                else:
+                    still_active.append(other)
+            active = still_active
+
+            allowed = self.allowed_registers(interval)
+            register = next((register for register in allowed if register in free), None)
+            if register is not None:
+                free.discard(register)
+                allocation.registers[interval.name] = register
+                active.append(interval)
+                continue
+
+            candidates = [other for other in active if allocation.registers[other.name] in allowed]
+            victim = max(candidates, key=lambda other: other.end, default=None)
+            if victim is not None and victim.end > interval.end:
+                allocation.registers[interval.name] = allocation.registers.pop(victim.name)
+                allocation.spill(victim.name)
+                active.remove(victim)
+                active.append(interval)
+            else:
+                allocation.spill(interval.name)
+        tracer.debug("Linear scan for %s: %d in registers, %d spilled", self.graph.name, len(allocation.registers), len(allocation.slots))
+
+
+class GraphColoringAllocator(RegisterAllocator):
+    # Chaitin-Briggs colouring of the interference graph built from liveness.
+    # Nodes are simplified while some node has fewer neighbours than usable
+    # registers; otherwise the node with the lowest weight/degree is pushed as a
+    # potential spill and only spilled if no colour is left for it in select.
+
+    def build_interference(self):
+        names = self.names
+        edges = {name: set() for name in sorted(self.intervals)}
+
+        def interfere(first, second):
+            if first != second and first in edges and second in edges:
+                edges[first].add(second)
+                edges[second].add(first)
+
+        for block in self.graph.blocks:
+            live = {name for name in self.live_out[block] if name in names}
+            for quad in reversed(block.quads):
+                if quad.op in DEFINING_OPS and quad.result in names:
+                    source = quad.arg1 if quad.op == Op.COPY else None
+                    for other in live:
+                        if other != source:
+                            interfere(quad.result, other)
+                    live.discard(quad.result)
+                for operand in operands(quad):
+                    if operand in names:
+                        live.add(operand)
+
+        # Parameters, and locals read before being set, all hold a value on entry
+        entry_live = [name for name in self.live_in[self.graph.entry] if name in names]
+        entry_live += [quad.result for quad in self.graph.entry.quads if quad.op == Op.PARAM]
+        for position, first in enumerate(entry_live):
+            for second in entry_live[position + 1:]:
+                interfere(first, second)
+        return edges
+
+    def assign_registers(self):
+        allocation = self.allocation
+        edges = self.build_interference()
+        degree = {name: len(neighbours) for name, neighbours in edges.items()}
+        limit = {name: len(self.allowed_registers(self.intervals[name])) for name in edges}
+
+        remaining = set(edges)
+        low = [name for name in edges if degree[name] < limit[name]]
+        stack = []
+        while remaining:
+            while low:
+                name = low.pop()
+                if name in remaining:
+                    break
+            else:
+                name = min(remaining, key=lambda name: (self.intervals[name].weight / (degree[name] + 1), name))
+            remaining.discard(name)
+            stack.append(name)
+            for neighbour in sorted(edges[name]):
+                if neighbour in remaining:
+                    degree[neighbour] -= 1
+                    if degree[neighbour] == limit[neighbour] - 1:
+                        low.append(neighbour)
+
+        while stack:
+            name = stack.pop()
+            taken = {allocation.registers.get(neighbour) for neighbour in edges[name]}
+            register = next((register for register in self.allowed_registers(self.intervals[name]) if register not in taken), None)
+            if register is None:
+                allocation.spill(name)
+            else:
+                allocation.registers[name] = register
+        tracer.debug("Graph colouring for %s: %d in registers, %d spilled", self.graph.name, len(allocation.registers), len(allocation.slots))
+
+
+ALLOCATORS = {
+    'linear': LinearScanAllocator,
+    'coloring': GraphColoringAllocator,
+}
+
+
+def allocate_registers(graph, method='linear'):
+    return ALLOCATORS[method](graph).allocate()
@@ -1,37 +1,53 @@
+import sys
+
+from tracing import get_tracer
+
+tracer = get_tracer('symboltable')
+
+
+class Scope:
+    def __init__(self, kind, parent=None):
+        self.kind = kind
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.symbols = {}
+        self.children = []
+
+
 class SymbolTable:
+    # Scopes form a tree with parent links and are kept for display, but lookups go
+    # through self.bindings, a single hash of name -> stack of visible entries
+    # (innermost last). Entering a scope costs nothing and leaving it pops the
+    # bindings it introduced, so lookup is O(1) whatever the nesting depth.
     def __init__(self):
-        self.global_scope = {}
+        self.global_scope = Scope('global')
         self.current_scope = self.global_scope
-        self.scope_stack = []
+        self.scope_stack = [self.global_scope]
+        self.bindings = {}
+        self.current_function = None
+        self.errors = []
 
-    def enter_scope(self):
-        new_scope = {}
-        self.current_scope = new_scope
+    def enter_scope(self, kind='block'):
+        new_scope = Scope(kind, self.current_scope)
+        self.current_scope.children.append(new_scope)
         self.scope_stack.append(new_scope)
+        self.current_scope = new_scope
+        return new_scope
 
     def exit_scope(self):
-        if self.scope_stack:
-            self.scope_stack.pop()
-            if len(self.scope_stack) > 0:
-                self.current_scope = self.scope_stack[-1]
-            else:
-                self.current_scope = None
+        if len(self.scope_stack) > 1:
+            scope = self.scope_stack.pop()
+            for lexeme in scope.symbols:
+                visible = self.bindings[lexeme]
+                visible.pop()
+                if not visible:
+                    del self.bindings[lexeme]
+            self.current_scope = self.scope_stack[-1]
         else:
-            print("Error: Trying to exit a non-existent scope.")
-
-    def create_new_scope(self):
-        return {}
-
-    def set_current_scope(self, scope):
-        self.current_scope = scope
-
-    def get_child(self, node, child_type):
-        for child in node.children:
-            if child.type == child_type:
-                return child
-        return None
+            tracer.error("Error: Trying to exit a non-existent scope.")
 
     def insert(self, line, lexeme, token, symbol_type=None, param_types=None):
+        lexeme = sys.intern(lexeme)
         entry = {
             'line': line,
             'lexeme': lexeme,
@@ -40,80 +56,74 @@ class SymbolTable:
             'param_types': param_types,
         }
 
-        print(f"Inserting {entry} into symbol table.")
-        self.current_scope[lexeme] = entry
-
-        self.display()
+        tracer.debug("Inserting %s into symbol table.", entry)
+        symbols = self.current_scope.symbols
+        if lexeme in symbols:
+            self.bindings[lexeme][-1] = entry
+        else:
+            self.bindings.setdefault(lexeme, []).append(entry)
+        symbols[lexeme] = entry
+        return entry
 
     def lookup(self, lexeme, scope=None):
         if scope is None:
-            scope = self.current_scope
+            visible = self.bindings.get(lexeme)
+            return visible[-1] if visible else None
+
+        # Resolve against a scope that is no longer open by walking its parents
+        while scope is not None:
+            if lexeme in scope.symbols:
+                return scope.symbols[lexeme]
+            scope = scope.parent
+        return None
+
+    def lookup_local(self, lexeme):
+        return self.current_scope.symbols.get(lexeme)
 
-        if lexeme in scope:
-            return scope[lexeme]
-        elif 'parent' in scope:
-            return self.lookup(lexeme, scope['parent'])
-        else:
-            return None
-        
     def add_function(self, function_name, return_type, param_types, current_token):
-        if function_name in self.current_scope:
+        if function_name in self.current_scope.symbols:
             self.error(f"Function '{function_name}' already declared in the current scope.", current_token)
 
-        function_info = {
-            'line': current_token[2],
-            'lexeme': function_name,
-            'token': current_token[0],
-            'type': return_type,
-            'param_types': param_types
-        }
-        self.current_scope[function_name] = function_info
-        self.current_function = function_info
+        self.current_function = self.insert(current_token[2], function_name, 'DEF', return_type, param_types)
+        self.enter_scope('function')
+        return self.current_function
 
     def end_function(self):
         self.exit_scope()
+        self.current_function = None
+
+    def entry_count(self):
+        # Symbols in every scope, open or closed
+        count = 0
+        scopes = [self.global_scope]
+        while scopes:
+            scope = scopes.pop()
+            count += len(scope.symbols)
+            scopes.extend(scope.children)
+        return count
 
-    def add_function_parameters(self, params_nodes, current_token):
-        print(f"Adding parameters in {params_nodes}")
-        for param in params_nodes:
-            param_name = param.value
-            param_type = param.type
-            print(f"Adding parameter {param_name} of type {param_type} to Symbol Table")
-            self.insert(
-                line=current_token[2],
-                lexeme=param_name,
-                token='ID',
-                symbol_type=param_type,
-                param_types=param_type
-            )
-        
-    def update_parameter_type(self, param_name, param_type, scope):
-        print(f"Updating parameter {param_name} to type {param_type}")
-        if param_name in scope:
-            scope[param_name]['type'] = param_type
-        else:
-            print(f"Error: Parameter {param_name} not found in the current scope.")
-    
     def get_current_function_info(self):
-        for symbol_info in reversed(list(self.global_scope.values())):
-            if symbol_info['token'] == 'DEF':
-                return symbol_info
-        return None
+        return self.current_function
 
-    def display(self, scope=None, indent=0):
+    def error(self, message, token=None):
+        if token is not None and len(token) >= 4:
+            self.errors.append(f"Error at line {token[2]}, position {token[3]}: {message}")
+        else:
+            self.errors.append(f"Error: {message}")
+
+    def display(self, scope=None, indent=0, file=None):
         if scope is None:
             scope = self.global_scope
-            print("Displaying Global Scope:")  
+            print("Displaying Global Scope:", file=file)
         else:
-            print(f"Displaying scope at indent level {indent}:")  
-
-        for key, value in scope.items():
-            if key != 'parent':
-                formatted_value = value.copy()
-                if isinstance(value['type'], Node):
-                    formatted_value['type'] = value['type'].type
-                if isinstance(value['param_types'], list):
-                    formatted_value['param_types'] = [param.type if isinstance(param, Node) else param for param in value['param_types']]
-                print('  ' * indent, key, ":", formatted_value)
-                if 'scope' in value:
-                    self.display(value['scope'], indent + 1)
+            print(f"Displaying {scope.kind} scope at indent level {indent}:", file=file)
+
+        for key, value in scope.symbols.items():
+            formatted_value = dict(value)
+            formatted_value['type'] = getattr(value['type'], 'type', value['type'])
+            if isinstance(value['param_types'], list):
+                formatted_value['param_types'] = [getattr(param, 'type', param) for param in value['param_types']]
+            print('  ' * indent, key, ":", formatted_value, file=file)
+        for child in scope.children:
+            if child.symbols or child.children:
+                self.display(child, indent + 1, file)
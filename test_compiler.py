@@ -0,0 +1,545 @@
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest import mock
+
+from cache import CompilationCache
+from cfg import ControlFlowGraph, build_cfgs, transfer_liveness
+from codegenerator import IntermediateCodeGenerator
+from incremental import IncrementalCompiler
+from ir import Op, Quad, Temp, DEFINING_OPS, format_ir, operands
+from lexer import Lexer
+from main import OUTPUTS, compile_file, compile_source, main
+from optimizer import Optimizer, fold_binary
+from parser import Parser
+from peephole import PeepholeOptimizer
+from pipeline import compile_functions
+from regalloc import ALLOCATORS, CALLEE_SAVED, allocate_registers, local_types
+from symboltable import SymbolTable
+
+
+def generate_ir(text):
+    program = Parser(Lexer(text).tokenize(), None).parse()
+    return IntermediateCodeGenerator(program, SymbolTable()).generate()
+
+
+def optimize_ir(text, passes):
+    optimizer = Optimizer(generate_ir(text), passes)
+    return optimizer.optimize(), optimizer.stats
+
+
+def printed(quads):
+    return [quad.arg1 for quad in quads if quad.op == Op.PRINT]
+
+
+def function_graphs(text):
+    global_quads, graphs = build_cfgs(generate_ir(text))
+    return {graph.name: graph for graph in graphs}
+
+
+def main_graph(text):
+    return function_graphs(text)['main']
+
+
+def register_pressure(count):
+    # f keeps count values live at once, and across the call made by print;
+    # the program prints 0, 1, 2 from f, then 3 * count * count
+    names = ", ".join(f"v{k}" for k in range(count))
+    assignments = "; ".join(f"v{k} = a * {k + 1} + {k}" for k in range(count))
+    total = " + ".join(f"v{k}" for k in range(count))
+    return (f"def int f(int a) int {names}; {assignments}; print v0; return {total} fed; "
+            "int i, s; s = 0; i = 0; while (i < 3) do s = s + f(i); i = i + 1 od; print s.")
+
+
+def function_quads(quads, name):
+    start = next(index for index, quad in enumerate(quads) if quad.op == Op.FUNC and quad.arg1 == name)
+    end = next((index for index in range(start + 1, len(quads)) if quads[index].op == Op.FUNC), len(quads))
+    return quads[start:end]
+
+
+class LexerTests(unittest.TestCase):
+
+    def test_token_buffer_reads_like_tokenize(self):
+        text = ("def double half(double x) return x / 2.0 fed;\n"
+                "int i, n; double d;\n  i = 0; n = 12 % 5; d = half(3.25) $ 1.5;\n"
+                "while ((i < n) and not (i == 3)) do print i; i = i + 1 od.\n")
+        expected = Lexer(text)
+        tokens = list(expected.tokenize())
+        for buffer_size in (3, 4096):
+            lexer = Lexer(io.BytesIO(text.encode()), buffer_size)
+            buffer = lexer.compact_tokens()
+            self.assertEqual(list(buffer), tokens)
+            self.assertEqual([buffer[index] for index in range(len(buffer))], tokens)
+            self.assertEqual(lexer.errors, expected.errors)
+        self.assertEqual(expected.errors, ["Unexpected character '$' at line 3, column 37"])
+
+
+class SyntaxErrorTests(unittest.TestCase):
+    # Inputs the parser recovers from must come back as errors, not crash the
+    # dump of the partial tree
+
+    def assert_reports_error(self, text, message):
+        outputs, errors = compile_source(text)
+        self.assertTrue(any(message in error for error in errors), errors)
+        self.assertIn("ast_output.txt", outputs)
+
+    def test_missing_boolean_operand(self):
+        self.assert_reports_error("int x; x = 1; if ((x < 1) or ) then print 1 fi.",
+                                  "Unexpected token 'RPAREN' in boolean term.")
+
+    def test_missing_argument(self):
+        self.assert_reports_error("def int f(int a) return a fed; print f(1, ).",
+                                  "Unexpected token 'RPAREN' in expression.")
+
+
+class TypeErrorTests(unittest.TestCase):
+
+    def test_double_argument_for_int_parameter(self):
+        outputs, errors = compile_source("def int f(int a, double b) return a fed; double d; d = 2.5; print f(d, 1).")
+        self.assertEqual(errors, ["Error: Error: Argument 1 of 'f' is 'double' but the parameter is 'int'"])
+        self.assertNotIn("asm_output.s", outputs)
+
+    def test_global_redeclaration(self):
+        outputs, errors = compile_source("int x; double x; print x.")
+        self.assertEqual(errors, ["Error: Error: Redeclaration of variable 'x'"])
+
+    def test_local_redeclaration(self):
+        outputs, errors = compile_source("def int f(int a) int b; double b; return a fed; print f(1).")
+        self.assertEqual(errors, ["Error: Error: Redeclaration of variable 'b'"])
+
+
+@unittest.skipUnless(shutil.which('gcc'), "needs gcc to assemble and run the output")
+class ExecutionTests(unittest.TestCase):
+
+    def run_program(self, text):
+        outputs, errors = compile_source(text)
+        self.assertEqual(errors, [])
+        return self.run_assembly(outputs["asm_output.s"])
+
+    def run_assembly(self, assembly):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'program.s'), 'w') as file:
+                file.write(assembly)
+            subprocess.run(['gcc', '-no-pie', '-o', os.path.join(directory, 'program'), os.path.join(directory, 'program.s')],
+                           check=True)
+            return subprocess.run([os.path.join(directory, 'program')], capture_output=True, text=True,
+                                  check=True).stdout.split()
+
+    def test_comparisons_with_nan_are_unordered(self):
+        conditions = ["n < one", "n <= one", "n > one", "n >= one", "n == n", "n <> n", "one < 2.0", "one == 1.0"]
+        statements = "; ".join(f"if ({condition}) then print 1 else print 0 fi" for condition in conditions)
+        output = self.run_program(f"double z, n, one; z = 0.0; one = 1.0; n = z / z; {statements}.")
+        self.assertEqual(output, ['0', '0', '0', '0', '0', '1', '1', '1'])
+
+    def test_names_of_runtime_and_libc_symbols(self):
+        output = self.run_program("def int print_double(int a) return a fed; def int printf(int a) return a + 1 fed; "
+                                  "int main, puts; main = printf(2); puts = print_double(3); print main + puts.")
+        self.assertEqual(output, ['6'])
+
+    def test_spilled_values_under_register_pressure(self):
+        program = Parser(Lexer(register_pressure(20)).tokenize(), None).parse()
+        for allocator in ALLOCATORS:
+            with self.subTest(allocator=allocator):
+                quads, asm_code, errors = compile_functions(program, allocator=allocator)
+                self.assertEqual(errors, [])
+                self.assertEqual(self.run_assembly("\n".join(asm_code) + "\n"), ['0', '1', '2', '1200'])
+
+
+class AstOutputTests(unittest.TestCase):
+
+    def test_operator_chain_is_not_indented_per_operator(self):
+        outputs, errors = compile_source("int x; x = " + " + ".join(["x"] * 500) + " - 1; print x.")
+        self.assertEqual(errors, [])
+        self.assertIn("BinOp op=" + "+ " * 499 + "-", outputs["ast_output.txt"])
+        self.assertLess(max(len(line) for line in outputs["ast_output.txt"].splitlines()), 2000)
+
+
+class CompileFileTests(unittest.TestCase):
+
+    def test_streamed_cached_and_replayed_outputs_match(self):
+        text = "def int f(int a) return a * 2 fed; int x; x = f(3); print x."
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'p.cp')
+            with open(source, 'w') as file:
+                file.write(text)
+            cache = CompilationCache(os.path.join(directory, 'cache'), 1 << 20)
+            runs = [(os.path.join(directory, 'plain'), None), (os.path.join(directory, 'stored'), cache),
+                    (os.path.join(directory, 'replayed'), cache)]
+            self.assertEqual([compile_file(source, output_dir, run_cache) for output_dir, run_cache in runs],
+                             [([], False), ([], False), ([], True)])
+            expected, errors = compile_source(text)
+            for output_dir, run_cache in runs:
+                for name in OUTPUTS:
+                    with open(os.path.join(output_dir, name)) as file:
+                        self.assertEqual(file.read(), expected[name])
+
+
+class ControlFlowGraphTests(unittest.TestCase):
+
+    def test_branches_meet_at_the_block_their_condition_dominates(self):
+        graph = main_graph("int x; x = 1; if (x < 2) then x = 3 else x = 4 fi; print x.")
+        condition = next(block for block in graph.blocks if block.quads[-1].op == Op.IF_FALSE)
+        join = next(block for block in graph.blocks if any(quad.op == Op.PRINT for quad in block.quads))
+        self.assertEqual(len(join.preds), 2)
+        self.assertIs(graph.idom[join], condition)
+        self.assertTrue(all(graph.dominates(condition, pred) for pred in join.preds))
+        self.assertEqual(graph.loops, [])
+
+    def test_deeply_nested_loops(self):
+        depth = 300
+        body = "s = s + 1"
+        for k in reversed(range(depth)):
+            body = f"i{k} = 0; while (i{k} < 2) do {body}; i{k} = i{k} + 1 od"
+        names = ", ".join(f"i{k}" for k in range(depth))
+        graph = main_graph(f"int s, {names}; s = 0; {body}; print s.")
+        self.assertEqual([loop.depth for loop in graph.loops], list(range(1, depth + 1)))
+        for outer, inner in zip(graph.loops, graph.loops[1:]):
+            self.assertIs(inner.parent, outer)
+            self.assertLess(inner.blocks, outer.blocks)
+        innermost = graph.loops[-1]
+        self.assertTrue(all(graph.loop_of[block] is innermost and graph.loop_depth(block) == depth
+                            for block in innermost.blocks))
+        self.assertEqual(graph.loop_depth(graph.entry), 0)
+
+
+class ConstantPropagationTests(unittest.TestCase):
+
+    def propagate(self, text):
+        return optimize_ir(text, ('constant_propagation',))
+
+    def test_constants_flow_into_folded_operations(self):
+        quads, stats = self.propagate("int x, y; x = 2; y = x * 3 + 1; print y.")
+        self.assertEqual(printed(quads), [7])
+        self.assertFalse(any(quad.op in (Op.MUL, Op.ADD) for quad in quads))
+        self.assertEqual(stats['operations folded'], 2)
+
+    def test_value_agreed_on_by_both_branches(self):
+        quads, stats = self.propagate("int x, y; y = 5; if (y > 2) then x = 1 else x = 1 fi; print x; "
+                                      "if (y > 2) then x = 2 else x = 3 fi; print x.")
+        self.assertEqual(printed(quads), [1, 'x'])
+
+    def test_variable_changed_in_loop_is_not_constant(self):
+        quads, stats = self.propagate("int i; i = 0; while (i < 3) do i = i + 1 od; print i.")
+        self.assertEqual(printed(quads), ['i'])
+        self.assertIn(Quad(Op.LT, Temp('t0'), 'i', 3, 'int'), quads)
+
+    def test_global_changed_by_call_is_not_constant(self):
+        quads, stats = self.propagate("def int f(int a) g = a; return a fed; int g, r; g = 1; r = f(2); print g.")
+        self.assertEqual(printed(quads), ['g'])
+
+    def test_division_by_zero_is_left_to_run_time(self):
+        quads, stats = self.propagate("int x; x = 7 / 0; print x.")
+        self.assertIn(Quad(Op.DIV, Temp('t0'), 7, 0, 'int'), quads)
+
+    def test_folding_matches_run_time_arithmetic(self):
+        self.assertEqual(fold_binary(Op.DIV, -7, 2), -3)
+        self.assertEqual(fold_binary(Op.MOD, -7, 2), -1)
+        self.assertEqual(fold_binary(Op.MUL, 1 << 62, 4), 0)
+        self.assertEqual(fold_binary(Op.ADD, (1 << 63) - 1, 1), -(1 << 63))
+        self.assertEqual(fold_binary(Op.DIV, 1, 4.0), 0.25)
+        self.assertIsNone(fold_binary(Op.MOD, 5.0, 2))
+
+
+class ValueNumberingTests(unittest.TestCase):
+
+    def number(self, text, passes=('value_numbering',)):
+        quads, stats = optimize_ir(text, passes)
+        return function_quads(quads, 'f'), stats
+
+    def count(self, quads, op):
+        return sum(quad.op == op for quad in quads)
+
+    def test_operands_in_either_order_share_a_value(self):
+        quads, stats = self.number("def int f(int a, int b) int x, y; x = a * b + 1; y = b * a + 2; return x + y fed; "
+                                   "print f(1, 2).")
+        self.assertEqual(self.count(quads, Op.MUL), 1)
+        self.assertIn(Quad(Op.ADD, Temp('t3'), Temp('t0'), 2, 'int'), quads)
+        self.assertEqual(stats['redundant expressions removed'], 1)
+
+    def test_value_from_a_dominating_block_is_reused(self):
+        text = ("def int f(int a, int b) int x, y; x = a * b; if (a < b) then y = a * b else y = b * a fi; "
+                "return x + y fed; print f(1, 2).")
+        quads, stats = self.number(text)
+        self.assertEqual(self.count(quads, Op.MUL), 1)
+        self.assertEqual(stats['redundant expressions removed'], 2)
+        quads, stats = self.number(text, ('local_value_numbering',))
+        self.assertEqual(self.count(quads, Op.MUL), 3)
+
+    def test_reassigned_operand_is_not_reused(self):
+        quads, stats = self.number("def int f(int a, int b) int x, y; x = a * b; if (a < b) then a = b fi; y = a * b; "
+                                   "return x + y fed; print f(1, 2).")
+        self.assertEqual(self.count(quads, Op.MUL), 2)
+        self.assertEqual(stats['redundant expressions removed'], 0)
+
+    def test_store_invalidates_loads_of_its_array(self):
+        quads, stats = self.number("def int f(int i) int a[4], x, y, z; x = a[i]; y = a[i]; a[i] = 2; z = a[i]; "
+                                   "return x + y + z fed; print f(1).")
+        self.assertEqual(self.count(quads, Op.LOAD), 2)
+        self.assertEqual(stats['redundant expressions removed'], 1)
+
+
+class DeadCodeEliminationTests(unittest.TestCase):
+
+    def eliminate(self, text, passes=('dead_code_elimination',)):
+        quads, stats = optimize_ir(text, passes)
+        return function_quads(quads, 'f'), stats
+
+    def test_unused_local_computations_are_removed(self):
+        quads, stats = self.eliminate("def int f(int a) int b, c; b = a * 2; c = a + 1; return c fed; print f(1).")
+        self.assertEqual([quad.op for quad in quads], [Op.FUNC, Op.PARAM, Op.ALLOC, Op.ALLOC, Op.ADD, Op.COPY, Op.RETURN])
+        self.assertEqual(stats['dead assignments removed'], 2)
+
+    def test_globals_and_trapping_divisions_are_kept(self):
+        quads, stats = self.eliminate("def int f(int a) int b; g = a * 2; b = 10 / a; return a fed; int g; print f(1).")
+        self.assertEqual([quad.op for quad in quads if quad.op in (Op.MUL, Op.DIV)], [Op.MUL, Op.DIV])
+        self.assertIn(Quad(Op.COPY, 'g', Temp('t0'), None, 'int'), quads)
+
+    def test_constant_branch_drops_the_unreachable_side(self):
+        quads, stats = self.eliminate("def int f(int a) int x; x = 1; if (x > 2) then print 5 else print 6 fi; return a fed; "
+                                      "print f(1).", ('constant_propagation', 'dead_code_elimination'))
+        self.assertEqual(printed(quads), [6])
+        self.assertFalse(any(quad.op in (Op.GOTO, Op.IF_FALSE) for quad in quads))
+        self.assertEqual(stats['constant branches folded'], 1)
+        self.assertGreaterEqual(stats['unreachable blocks removed'], 1)
+
+    def test_liveness_around_a_loop(self):
+        graph = function_graphs("def int f(int n) int i, s, t; s = 0; i = 0; t = 9; while (i < n) do s = s + i; "
+                                "i = i + 1 od; return s fed; print f(3).")['f']
+        live_in, live_out = graph.liveness()
+        header = graph.loops[0].header
+        self.assertEqual(live_in[graph.entry], {'n'})
+        self.assertEqual(live_in[header], {'i', 'n', 's'})
+        self.assertTrue(all(live_out[block] == set() for block in graph.blocks if not block.succs))
+
+
+class RegisterAllocationTests(unittest.TestCase):
+
+    def assert_valid(self, graph, allocation):
+        # A value may not share a register with anything live where it is
+        # defined (bar the source of a copy), and one live across a call must be
+        # in a callee-saved register
+        registers = allocation.registers
+        live_in, live_out = graph.liveness()
+        for block in graph.blocks:
+            live = set(live_out[block])
+            for quad in reversed(block.quads):
+                if quad.op in DEFINING_OPS and quad.result in registers:
+                    for name in live - {quad.result}:
+                        if not (quad.op == Op.COPY and name == quad.arg1):
+                            self.assertNotEqual(registers.get(name), registers[quad.result], (quad, name))
+                if quad.op in (Op.CALL, Op.PRINT):
+                    for name in live - {quad.result}:
+                        self.assertIn(registers.get(name, CALLEE_SAVED[0]), CALLEE_SAVED, (quad, name))
+                transfer_liveness(quad, live)
+
+    def test_allocators_spill_under_register_pressure(self):
+        quads, stats = optimize_ir(register_pressure(20), Optimizer.PASSES)
+        global_quads, graphs = build_cfgs(quads)
+        for method in ALLOCATORS:
+            with self.subTest(method=method):
+                allocation = allocate_registers(graphs[0], method)
+                self.assert_valid(graphs[0], allocation)
+                self.assertTrue(allocation.slots)
+                used = {name for quad in graphs[0].quads() for name in operands(quad)}
+                used.update(quad.result for quad in graphs[0].quads() if quad.op in DEFINING_OPS)
+                self.assertTrue(all(allocation.location(name) is not None for name in used & set(local_types(graphs[0]))))
+
+    def test_values_fit_in_registers_without_pressure(self):
+        quads, stats = optimize_ir(register_pressure(4), Optimizer.PASSES)
+        global_quads, graphs = build_cfgs(quads)
+        for method in ALLOCATORS:
+            with self.subTest(method=method):
+                allocation = allocate_registers(graphs[0], method)
+                self.assert_valid(graphs[0], allocation)
+                self.assertEqual(allocation.slots, {})
+
+
+class PeepholeTests(unittest.TestCase):
+    # rule: (lines it rewrites, what they become, similar lines it must leave alone)
+    CASES = {
+        'self_move': (["movq %rbx, %rbx"], [], ["movq %rbx, %rcx"]),
+        'redundant_move': (["movq %rbx, -8(%rbp)", "movq -8(%rbp), %rbx"], ["movq %rbx, -8(%rbp)"],
+                           ["movq (%rbx), %rbx", "movq %rbx, (%rbx)"]),
+        'multiply_by_power_of_two': (["imulq $8, %rbx"], ["salq $3, %rbx"], ["imulq $6, %rbx"]),
+        'branch_on_flags': (["setl %al", "movzbq %al, %rcx", "cmpq $0, %rcx", "je L1"],
+                            ["setl %al", "movzbq %al, %rcx", "jge L1"],
+                            ["setl %al", "movzbq %al, %rcx", "cmpq $0, %rdx", "je L1"]),
+        'dead_condition': (["setl %al", "movzbq %al, %rax", "jge L1"], ["jge L1"],
+                           ["setl %al", "movzbq %al, %rcx", "jge L1"]),
+        'branch_over_jump': (["jl L1", "jmp L2", "L1:"], ["jge L2", "L1:"], ["jl L1", "jmp L2", "L3:"]),
+        'jump_to_next': (["jmp L1", "L1:"], ["L1:"], ["jmp L1", "L2:"]),
+    }
+
+    def optimize(self, lines, rules=None):
+        # Instructions are indented, labels are not
+        optimizer = PeepholeOptimizer([line if line.endswith(':') else f"    {line}" for line in lines], rules)
+        return [line.strip() for line in optimizer.optimize()], optimizer.stats
+
+    def test_each_rule_fires(self):
+        for rule, (before, after, unchanged) in self.CASES.items():
+            with self.subTest(rule=rule):
+                self.assertEqual(self.optimize(before, (rule,)), (after, {rule: 1}))
+
+    def test_each_rule_leaves_lookalikes_alone(self):
+        for rule, (before, after, unchanged) in self.CASES.items():
+            with self.subTest(rule=rule):
+                self.assertEqual(self.optimize(unchanged), (unchanged, {}))
+
+    def test_rules_compose(self):
+        lines, stats = self.optimize(["sete %al", "movzbq %al, %rax", "cmpq $0, %rax", "je L1", "jmp L2", "L1:"])
+        self.assertEqual(lines, ["je L2", "L1:"])
+        self.assertEqual(stats, {'branch_on_flags': 1, 'dead_condition': 1, 'branch_over_jump': 1})
+
+
+class LoopInvariantCodeMotionTests(unittest.TestCase):
+
+    def hoist(self, text):
+        return optimize_ir(text, ('loop_invariant_code_motion',))
+
+    def test_invariant_leaves_both_nested_loops(self):
+        quads, stats = self.hoist("def int f(int a, int b) int i, j, s; s = 0; i = 0; "
+                                  "while (i < 3) do j = 0; while (j < 3) do s = s + a * b; j = j + 1 od; i = i + 1 od; "
+                                  "return s fed; print f(2, 3).")
+        # The product moves into the outer loop's preheader, right before its header L0
+        product = next(index for index, quad in enumerate(quads) if quad.op == Op.MUL)
+        self.assertEqual([(quad.op, quad.arg1) for quad in quads[product - 1:product + 2:2]],
+                         [(Op.LABEL, "L0_pre"), (Op.LABEL, "L0")])
+        self.assertEqual(stats['loop invariants hoisted'], 1)
+
+    def test_hundreds_of_loops_rebuild_the_graph_once(self):
+        loops = "; ".join(f"i = 0; while (i < 2) do s = s + (a * b + {k}); i = i + 1 od" for k in range(400))
+        with mock.patch('optimizer.ControlFlowGraph', wraps=ControlFlowGraph) as rebuilt:
+            quads, stats = self.hoist(f"def int f(int a, int b) int i, s; s = 0; {loops}; return s fed; print f(2, 3).")
+        self.assertEqual(rebuilt.call_count, 1)
+        self.assertEqual(stats['loop invariants hoisted'], 800)
+
+
+class CacheTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_key_follows_source_compiler_and_options(self):
+        cache = CompilationCache(self.directory, 1 << 20)
+        key = cache.key("print 1.")
+        self.assertEqual(cache.key(io.StringIO("print 1.")), key)
+        self.assertEqual(cache.key(io.BytesIO(b"print 1.")), key)
+        self.assertNotEqual(cache.key("print 2."), key)
+        self.assertNotEqual(cache.key("print 1.", ('-O0',)), key)
+        with mock.patch('cache._fingerprint', 'edited compiler'):
+            self.assertNotEqual(cache.key("print 1."), key)
+
+    def test_edited_source_misses(self):
+        source = os.path.join(self.directory, 'p.cp')
+        cache = CompilationCache(os.path.join(self.directory, 'cache'), 1 << 20)
+        results = []
+        for text in ("int x; x = 1; print x.", "int x; x = 1; print x.", "int x; x = 2; print x."):
+            with open(source, 'w') as file:
+                file.write(text)
+            output_dir = os.path.join(self.directory, f"out{len(results)}")
+            results.append(compile_file(source, output_dir, cache))
+            with open(os.path.join(output_dir, 'asm_output.s')) as file:
+                self.assertEqual(file.read(), compile_source(text)[0]["asm_output.s"])
+        self.assertEqual(results, [([], False), ([], True), ([], False)])
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_corrupt_entry_is_a_miss(self):
+        cache = CompilationCache(self.directory, 1 << 20)
+        cache.put('ab12', {'outputs': {}, 'errors': []})
+        with open(cache.path('ab12'), 'w') as file:
+            file.write('{"outputs": ')
+        self.assertIsNone(cache.get('ab12'))
+        self.assertEqual(cache.misses, 1)
+
+    def test_eviction_removes_least_recently_used_first(self):
+        cache = CompilationCache(self.directory, 1 << 20)
+        for age, key in enumerate(('aa01', 'bb02', 'cc03')):
+            cache.put(key, {'outputs': {'tokens.txt': key}, 'errors': []})
+            os.utime(cache.path(key), (1000 + age, 1000 + age))
+        self.assertIsNotNone(cache.get('aa01'))
+        size = os.path.getsize(cache.path('aa01'))
+        cache.max_bytes = 2 * size
+        self.assertEqual(cache.evict(), 1)
+        self.assertEqual([key for key in ('aa01', 'bb02', 'cc03') if os.path.exists(cache.path(key))], ['aa01', 'cc03'])
+        cache.max_bytes = 0
+        self.assertEqual(cache.evict(), 2)
+        self.assertEqual(cache.entries(), [])
+
+
+class IncrementalTests(unittest.TestCase):
+    FUNCTIONS = ["def int f{k}(int a) int b; b = a * {k}; return b + {k} fed;".format(k=k) for k in range(3)]
+    TEXT = " ".join(FUNCTIONS) + " int x; x = f0(1) + f1(2) + f2(3); print x."
+
+    def update(self, compiler, text):
+        # Updates compiler to text and checks it against a full compile; returns
+        # what the update did
+        before = compiler.stats.copy()
+        errors = compiler.update(text)
+        outputs, expected = compile_source(text)
+        self.assertEqual(errors, expected)
+        self.assertEqual("".join(f"{token[0]}: {token[1]}\n" for token in compiler.tokens()), outputs["tokens.txt"])
+        if not errors:
+            intermediate = io.StringIO()
+            format_ir(compiler.quads, file=intermediate)
+            assembly = "".join(f"{line}\n" for line in compiler.assembly())
+            self.assertEqual(f"Intermediate Code:\n{intermediate.getvalue()}Assembly Code:\n{assembly}",
+                             outputs["icg_output.txt"])
+            self.assertEqual(assembly, outputs["asm_output.s"])
+        return compiler.stats - before
+
+    def test_edit_inside_a_function_body(self):
+        compiler = IncrementalCompiler()
+        self.update(compiler, self.TEXT)
+        done = self.update(compiler, self.TEXT.replace("a * 1", "a * 7 - a"))
+        # Only f1 is relexed (22 tokens and the 2 added), reparsed and regenerated
+        self.assertEqual(done, {'tokens relexed': 24, 'regions reparsed': 1, 'functions regenerated': 1})
+
+    def test_signature_change_regenerates_every_function(self):
+        compiler = IncrementalCompiler()
+        self.update(compiler, self.TEXT)
+        done = self.update(compiler, self.TEXT.replace("f2(int a)", "f2(int a, int c)").replace("f2(3)", "f2(3, 4)"))
+        self.assertEqual(done['functions regenerated'], 4)
+        self.assertEqual(done['full compiles'], 0)
+
+    def test_syntax_error_compiles_from_scratch(self):
+        compiler = IncrementalCompiler()
+        self.update(compiler, self.TEXT)
+        done = self.update(compiler, self.TEXT.replace("b = a * 1;", "b = a * ;"))
+        self.assertEqual(done['full compiles'], 1)
+        self.update(compiler, self.TEXT.replace("a * 1", "a * 5"))
+        self.assertEqual(compiler.errors, [])
+
+    def test_run_of_edits(self):
+        compiler = IncrementalCompiler()
+        text = self.TEXT
+        self.update(compiler, text)
+        for step in range(12):
+            position = text.index(f"a * {step % 3}")
+            text = f"{text[:position]}a * {step + 3} + {step}{text[position + 5:]}"
+            self.update(compiler, text)
+            text = text.replace(f"a * {step + 3} + {step}", f"a * {step % 3}")
+            self.update(compiler, text)
+
+
+class DriverTests(unittest.TestCase):
+
+    def test_missing_default_source(self):
+        with tempfile.TemporaryDirectory() as directory:
+            previous = os.getcwd()
+            os.chdir(directory)
+            try:
+                with redirect_stderr(io.StringIO()) as stderr:
+                    self.assertEqual(main(['--no-cache']), 2)
+            finally:
+                os.chdir(previous)
+        self.assertIn("No such file or directory: Test9.cp", stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
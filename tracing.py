@@ -0,0 +1,85 @@
+import os
+import sys
+
+# Trace levels, from quietest to noisiest
+OFF = 0
+ERROR = 1
+INFO = 2
+DEBUG = 3
+TRACE = 4
+
+LEVELS = {
+    'off': OFF,
+    'error': ERROR,
+    'info': INFO,
+    'debug': DEBUG,
+    'trace': TRACE,
+}
+
+SUBSYSTEMS = ('lexer', 'parser', 'symboltable', 'codegen', 'optimizer', 'cache', 'incremental')
+
+
+def discard(message, *args):
+    pass
+
+
+class Tracer:
+    # One tracer per subsystem. The error/info/debug/trace methods of a tracer whose
+    # level is too low are rebound to discard(), so a disabled call site never builds
+    # its message: arguments are only %-formatted once a message is actually written.
+    def __init__(self, subsystem, level=OFF, stream=None):
+        self.subsystem = subsystem
+        self.stream = stream
+        self.set_level(level)
+
+    def set_level(self, level):
+        self.level = level
+        self.error = self.emit if level >= ERROR else discard
+        self.info = self.emit if level >= INFO else discard
+        self.debug = self.emit if level >= DEBUG else discard
+        self.trace = self.emit if level >= TRACE else discard
+
+    def emit(self, message, *args):
+        if args:
+            message = message % args
+        stream = self.stream if self.stream is not None else sys.stderr
+        stream.write(f"[{self.subsystem}] {message}\n")
+
+
+TRACERS = {subsystem: Tracer(subsystem) for subsystem in SUBSYSTEMS}
+
+
+def get_tracer(subsystem):
+    return TRACERS[subsystem]
+
+
+def parse_level(level):
+    if isinstance(level, int):
+        return level
+    if level not in LEVELS:
+        raise ValueError(f"Unknown trace level '{level}'. Expected one of {', '.join(LEVELS)}.")
+    return LEVELS[level]
+
+
+def configure(spec=None, stream=None):
+    # spec is a level for every subsystem ('debug') and/or per-subsystem switches
+    # ('parser=trace,codegen=info'); subsystems not mentioned are left as they are.
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '=' in item:
+            subsystem, level = item.split('=', 1)
+            if subsystem.strip() not in TRACERS:
+                raise ValueError(f"Unknown trace subsystem '{subsystem.strip()}'. Expected one of {', '.join(SUBSYSTEMS)}.")
+            TRACERS[subsystem.strip()].set_level(parse_level(level.strip()))
+        else:
+            for tracer in TRACERS.values():
+                tracer.set_level(parse_level(item))
+    for tracer in TRACERS.values():
+        tracer.stream = stream
+
+
+def configure_from_environment():
+    # COMPILER_TRACE uses the same syntax as configure(), e.g. COMPILER_TRACE=parser=debug
+    configure(os.environ.get('COMPILER_TRACE'))